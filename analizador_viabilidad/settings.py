@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -20,8 +21,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Cargar variables de entorno desde la raíz del proyecto
 load_dotenv(os.path.join(BASE_DIR, '.env'))
 
-# Configurar API key de Gemini
-os.environ.setdefault("GEMINI_API_KEY", )
+# La API key de Gemini se lee de GEMINI_API_KEY (o GOOGLE_API_KEY) en core.llm_service
 
 
 # Quick-start development settings - unsuitable for production
@@ -91,6 +91,42 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Con REDIS_URL definida la caché se comparte entre procesos (necesario para que
+# los análisis de IA cacheados sirvan a todos los workers); si no, se usa memoria local.
+
+REDIS_URL = os.environ.get("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        },
+        # Análisis de IA cacheados, con su propio prefijo para poder vaciarlos
+        # o expirarlos sin tocar el resto de la caché
+        "llm": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "feasai-llm",
+        },
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+        # Cada análisis ocupa varios KB: almacén aparte para que no desplace
+        # al resto de entradas de la caché por defecto
+        "llm": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "llm",
+            "OPTIONS": {"MAX_ENTRIES": 1000},
+        },
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -109,6 +145,15 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Ejecución de la suite con manage.py test; bajo pytest el hasher lo fija
+# conftest.py, para no depender de qué módulos haya importados en el proceso
+TESTING = sys.argv[1:2] == ['test']
+
+if TESTING:
+    # PBKDF2 cuesta decenas de milisegundos por hash y casi todos los tests crean
+    # usuarios o inician sesión; en tests basta con un hasher trivial
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -136,3 +181,21 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 LOGIN_URL = '/usuarios/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
+
+# Límite de peticiones por minuto a cada proveedor de IA (por proceso).
+# Se puede ajustar sin tocar código mediante variables de entorno; 0 desactiva el límite.
+LLM_RATE_LIMITS = {
+    'cerebras': int(os.environ.get("CEREBRAS_RPM", 60)),
+    'gemini': int(os.environ.get("GEMINI_RPM", 15)),
+}
+
+# Con ANALISIS_EN_SEGUNDO_PLANO=1 el formulario de home no espera al modelo: guarda
+# la búsqueda como pendiente, lanza el análisis en un hilo del propio proceso y
+# redirige a una página que se recarga hasta que el resultado está listo.
+# Desactivado por defecto: el análisis se hace dentro de la petición.
+ANALISIS_EN_SEGUNDO_PLANO = os.environ.get("ANALISIS_EN_SEGUNDO_PLANO", "") == "1"
+ANALISIS_HILOS = int(os.environ.get("ANALISIS_HILOS", 4))
+# Segundos tras los que un análisis que sigue pendiente se da por fallido (por
+# ejemplo, porque el proceso se reinició a mitad). Cubre de sobra los tres
+# intentos de 30 s del servicio de IA con sus esperas entre reintentos
+ANALISIS_TIEMPO_MAXIMO = int(os.environ.get("ANALISIS_TIEMPO_MAXIMO", 180))
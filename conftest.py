@@ -0,0 +1,38 @@
+"""
+Configuración compartida de pytest para el proyecto.
+
+Los micro-benchmarks (tests que usan el fixture benchmark de pytest-benchmark)
+no se ejecutan por defecto: miden rendimiento, no corrección, y alargarían cada
+ejecución de la suite. Para lanzarlos:
+
+    pytest --benchmarks --benchmark-only
+
+Además, la suite hashea las contraseñas con MD5: PBKDF2 cuesta decenas de
+milisegundos por hash y casi todos los tests crean usuarios o inician sesión.
+"""
+
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmarks",
+        action="store_true",
+        default=False,
+        help="Ejecuta también los micro-benchmarks (requiere pytest-benchmark)",
+    )
+
+
+def pytest_configure(config):
+    from django.conf import settings
+
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--benchmarks"):
+        return
+    omitir = pytest.mark.skip(reason="micro-benchmark: usar --benchmarks para ejecutarlo")
+    for item in items:
+        if "benchmark" in getattr(item, "fixturenames", ()):
+            item.add_marker(omitir)
@@ -9,10 +9,29 @@ técnicas sino también los costos, datos requeridos y alternativas tradicionale
 """
 
 import os  # Para acceder a variables de entorno del sistema
+import logging  # Para registrar el detalle de cada llamada sin escribir en stdout
+import re  # Para saltar espacios en blanco al parsear JSON incrementalmente
 import json  # Para manejar datos en formato JSON, clave para las respuestas de los modelos
-from cerebras.cloud.sdk import Cerebras  # Cliente oficial para la API de Cerebras
+import orjson  # Parser JSON nativo, bastante más rápido que json para respuestas de varios KB
+import asyncio  # Para las variantes asíncronas que solapan varias llamadas de red
+import functools  # Para pasar argumentos con nombre a las llamadas ejecutadas en hilos
+import hashlib  # Para generar claves de caché deterministas a partir del problema
+import threading  # Para proteger el estado compartido de los limitadores de tasa
+from concurrent.futures import Future, ThreadPoolExecutor  # Deduplicación de llamadas e hilos para Gemini
+from typing import Protocol  # Interfaz común de los proveedores de IA
+import time  # Reloj monotónico y esperas del limitador de tasa
+from functools import lru_cache  # Para construir el modelo de Gemini una sola vez
+import httpx  # Cliente HTTP subyacente del SDK de Cerebras; permite ajustar el pool de conexiones
+from django.conf import settings  # Límites de peticiones configurables por entorno
+from django.core.cache import caches  # Caché compartida de Django para reutilizar análisis ya realizados
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type  # Reintentos con backoff exponencial
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras, DefaultHttpxClient  # Clientes oficiales (síncrono y asíncrono) para la API de Cerebras
+from cerebras.cloud.sdk import RateLimitError, APIConnectionError, InternalServerError  # Errores transitorios de Cerebras
 import google.generativeai as genai  # Biblioteca para interactuar con modelos de Google Gemini
 from google.generativeai import types  # Necesario para configurar la generación de respuestas
+from google.api_core import exceptions as google_exceptions  # Errores transitorios de Gemini (429/5xx)
+
+logger = logging.getLogger(__name__)
 
 # Configuración inicial para Cerebras: obtenemos la clave API desde las variables de entorno
 # Esta clave es esencial para autenticar las llamadas a la API de Cerebras
@@ -20,57 +39,218 @@ CEREBRAS_API_KEY = os.environ.get("CEREBRAS_API_KEY")
 if not CEREBRAS_API_KEY:
     # Si no está configurada, mostramos una advertencia pero no detenemos la ejecución
     # Esto permite que otros modelos funcionen aunque Cerebras no esté disponible
-    print("Advertencia: La variable de entorno CEREBRAS_API_KEY no está configurada.")
-
+    logger.warning("La variable de entorno CEREBRAS_API_KEY no está configurada.")
+
+# Tiempo máximo (en segundos) que esperamos a un proveedor. En Cerebras se aplica en el
+# propio cliente HTTP (síncrono y asíncrono); en las variantes asíncronas además acota la
+# llamada completa, reintentos incluidos
+TIMEOUT_LLM_SEGUNDOS = 30
+
+# Clientes compartidos: se crean una sola vez y los reutilizan todas las llamadas.
+# Así las conexiones keep-alive (y su handshake TLS) sobreviven entre peticiones
+# en lugar de abrir un pool nuevo en cada análisis.
+# Los reintentos los gestiona tenacity (ver _llamar_cerebras), por eso se desactivan
+# los del SDK: si no, cada intento nuestro multiplicaría los suyos.
+_CLIENTE_CEREBRAS = Cerebras(
+    api_key=CEREBRAS_API_KEY,
+    timeout=TIMEOUT_LLM_SEGUNDOS,
+    max_retries=0,
+    http_client=DefaultHttpxClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    ),
+) if CEREBRAS_API_KEY else None
+_CLIENTE_CEREBRAS_ASYNC = AsyncCerebras(
+    api_key=CEREBRAS_API_KEY,
+    timeout=TIMEOUT_LLM_SEGUNDOS,
+    max_retries=0,
+) if CEREBRAS_API_KEY else None
+
+# Política de reintentos ante errores transitorios (límite de peticiones, caídas de red, 5xx):
+# hasta 3 intentos con espera exponencial de 1 a 10 segundos. Cualquier otro error falla
+# al primer intento y, si se agotan los intentos, se propaga la excepción original.
+_ERRORES_TRANSITORIOS_CEREBRAS = (RateLimitError, APIConnectionError, InternalServerError)
+_ERRORES_TRANSITORIOS_GEMINI = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+)
+_POLITICA_REINTENTOS = dict(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, max=10),
+    reraise=True,
+)
+
+class _LimitadorTasa:
+    """
+    Token bucket que limita las peticiones por minuto a un proveedor.
 
-def disenar_prompt_robusto(problema_del_usuario: str) -> str:
+    Se comparte entre hilos (vistas síncronas) y corrutinas (variantes asíncronas):
+    cada llamada reserva un token bajo un lock y, si no queda ninguno, espera fuera
+    del lock el tiempo que tarda en reponerse. Al reservar por adelantado, las
+    llamadas que llegan a la vez se reparten en el tiempo en lugar de competir.
+    El límite es por proceso: con varios workers, el total es la suma de todos.
     """
-    Diseña un prompt sofisticado y crítico para que los modelos de IA analicen
-    la viabilidad de aplicar inteligencia artificial a un problema específico.
 
-    Este prompt está diseñado para obtener análisis realistas y pragmáticos,
-    enfocándose en costos, datos y alternativas, en lugar de ser excesivamente
-    optimista como lo hacen muchos análisis de IA.
+    def __init__(self, peticiones_por_minuto: int):
+        self.capacidad = float(peticiones_por_minuto)
+        self.tasa = peticiones_por_minuto / 60.0  # Tokens que se reponen por segundo
+        self._tokens = self.capacidad
+        self._ultima_recarga = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reservar(self) -> float:
+        """Consume un token y devuelve cuántos segundos hay que esperar para usarlo."""
+        if self.tasa <= 0:
+            return 0.0  # Límite desactivado
+        with self._lock:
+            ahora = time.monotonic()
+            self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultima_recarga) * self.tasa)
+            self._ultima_recarga = ahora
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.tasa
+
+    def adquirir(self):
+        """Bloquea el hilo hasta que haya un token disponible."""
+        espera = self._reservar()
+        if espera > 0:
+            time.sleep(espera)
+
+    async def adquirir_async(self):
+        """Espera sin bloquear el event loop hasta que haya un token disponible."""
+        espera = self._reservar()
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+
+# Un limitador por proveedor; los límites se ajustan con LLM_RATE_LIMITS en settings
+_LIMITES_TASA = getattr(settings, 'LLM_RATE_LIMITS', {})
+_LIMITADOR_CEREBRAS = _LimitadorTasa(_LIMITES_TASA.get('cerebras', 60))
+_LIMITADOR_GEMINI = _LimitadorTasa(_LIMITES_TASA.get('gemini', 15))
+
+# Tiempo de vida de un análisis en caché: una semana
+LLM_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Alias de caché de los análisis: 'llm' si el proyecto lo define, si no la caché por defecto
+LLM_CACHE_ALIAS = 'llm' if 'llm' in settings.CACHES else 'default'
+
+
+def _clave_cache(model: str, problema_usuario: str):
+    """
+    Calcula la clave de caché de un análisis a partir del modelo y el problema.
 
-    Parámetros:
-        problema_del_usuario: La descripción del problema o proyecto que se quiere analizar
+    El problema se normaliza (minúsculas y espacios colapsados) para que las
+    variantes que solo difieren en mayúsculas, saltos de línea o espacios
+    compartan el mismo análisis en lugar de repetir la llamada al modelo.
 
     Retorna:
-        Un string con el prompt completo en español, listo para enviar a un modelo de IA
+        String con la clave, o None si el problema no es un texto cacheable
     """
-    # Validación exhaustiva del input para evitar errores posteriores
-    # Es crítico validar aquí porque los modelos de IA pueden fallar de formas extrañas con inputs inválidos
-    # print(f"Debug: problema_del_usuario recibido: '{problema_del_usuario}' (tipo: {type(problema_del_usuario)})")
-
-    if problema_del_usuario is None:
-        print("Error: problema_del_usuario es None")
+    if not isinstance(problema_usuario, str):
         return None
+    problema_normalizado = " ".join(problema_usuario.lower().split())
+    return "llm:" + hashlib.sha256(f"{model}|{problema_normalizado}".encode()).hexdigest()
 
-    if not isinstance(problema_del_usuario, str):
-        print(f"Error: problema_del_usuario no es string, es {type(problema_del_usuario)}")
-        return None
 
-    problema_stripped = problema_del_usuario.strip()
-    if not problema_stripped:
-        print("Error: problema_del_usuario está vacío después de strip")
-        return None
+def _leer_cache(clave):
+    """
+    Devuelve el análisis guardado bajo la clave, o None si no existe.
 
-    if len(problema_stripped) < 10:
-        print(f"Error: problema_del_usuario es demasiado corto: {len(problema_stripped)} caracteres")
+    Un fallo del backend de caché nunca debe impedir el análisis, así que
+    cualquier error se registra y se trata como un fallo de caché.
+    """
+    if clave is None:
+        return None
+    try:
+        return caches[LLM_CACHE_ALIAS].get(clave)
+    except Exception as e:
+        logger.warning("Error al leer la caché de análisis: %s", e)
         return None
 
-    # Construcción del prompt principal con instrucciones detalladas
-    # Este prompt está diseñado específicamente para obtener análisis críticos y realistas
-    # La instrucción de ser "crítico y pragmático" es fundamental para evitar el sesgo optimista común en análisis de IA
-    prompt = f"""ACTÚA COMO UN CONSULTOR SENIOR DE IA, PRAGMÁTICO Y CRÍTICO.
-Tu objetivo principal no es ser optimista, sino realista. Analiza los costos, los requisitos de datos y las alternativas no-IA. Tu reputación depende de evitar que los clientes inviertan en proyectos de IA inviables.
-La respuesta DEBE SER ÚNICAMENTE un objeto JSON válido, sin ningún texto o explicación fuera del propio JSON.
 
-PROBLEMA O PROYECTO A ANALIZAR: {problema_stripped}
+def _guardar_cache(clave, resultado_dict: dict):
+    """Guarda un análisis exitoso en caché; los errores nunca se cachean."""
+    if clave is None or "error" in resultado_dict:
+        return
+    try:
+        caches[LLM_CACHE_ALIAS].set(clave, resultado_dict, timeout=LLM_CACHE_TIMEOUT)
+    except Exception as e:
+        logger.warning("Error al guardar en la caché de análisis: %s", e)
 
-El objeto JSON de salida debe seguir estrictamente la siguiente estructura:
 
-{{
+# Llamadas a proveedores en curso, indexadas por la clave de caché del análisis.
+# Si llega una consulta idéntica mientras otra espera al modelo, se engancha a esa
+# llamada en lugar de lanzar una nueva ("singleflight"); al terminar, la caché
+# sirve a las siguientes. En la variante asíncrona la clave incluye el event loop,
+# porque una tarea solo puede esperarse desde su propio loop.
+_EN_CURSO = {}
+_EN_CURSO_LOCK = threading.Lock()
+_EN_CURSO_ASYNC = {}
+
+
+def _deduplicar(clave, llamada):
+    """
+    Ejecuta llamada() salvo que ya haya una en curso con la misma clave, en cuyo
+    caso espera y devuelve su resultado (o relanza su excepción).
+    """
+    if clave is None:
+        return llamada()
+
+    with _EN_CURSO_LOCK:
+        futuro = _EN_CURSO.get(clave)
+        es_lider = futuro is None
+        if es_lider:
+            futuro = Future()
+            _EN_CURSO[clave] = futuro
+
+    if not es_lider:
+        return futuro.result()
+
+    try:
+        resultado = llamada()
+        futuro.set_result(resultado)
+        return resultado
+    except BaseException as e:
+        futuro.set_exception(e)
+        raise
+    finally:
+        with _EN_CURSO_LOCK:
+            _EN_CURSO.pop(clave, None)
+
+
+async def _deduplicar_async(clave, crear_corrutina):
+    """
+    Variante asíncrona de _deduplicar.
+
+    La llamada se lanza como tarea independiente y cada interesado la espera a
+    través de asyncio.shield: si uno cancela su espera (por ejemplo por timeout)
+    la llamada compartida sigue en marcha para el resto.
+    """
+    if clave is None:
+        return await crear_corrutina()
+
+    loop = asyncio.get_running_loop()
+    clave_loop = (loop, clave)
+    tarea = _EN_CURSO_ASYNC.get(clave_loop)
+    if tarea is None:
+        tarea = loop.create_task(crear_corrutina())
+        _EN_CURSO_ASYNC[clave_loop] = tarea
+        tarea.add_done_callback(lambda _: _EN_CURSO_ASYNC.pop(clave_loop, None))
+    return await asyncio.shield(tarea)
+
+
+# Plantilla del prompt de análisis, construida una sola vez al importar el módulo.
+# Está diseñada específicamente para obtener análisis críticos y realistas: la instrucción
+# de ser "crítico y pragmático" es fundamental para evitar el sesgo optimista común en análisis de IA.
+# {p} se sustituye por el problema del usuario; las llaves literales del JSON van escapadas ({{ }}).
+# Las instrucciones y la estructura del JSON se comparten con el prompt por lotes.
+_PROMPT_INSTRUCCIONES = """ACTÚA COMO UN CONSULTOR SENIOR DE IA, PRAGMÁTICO Y CRÍTICO.
+Tu objetivo principal no es ser optimista, sino realista. Analiza los costos, los requisitos de datos y las alternativas no-IA. Tu reputación depende de evitar que los clientes inviertan en proyectos de IA inviables.
+La respuesta DEBE SER ÚNICAMENTE un objeto JSON válido, sin ningún texto o explicación fuera del propio JSON."""
+
+_PROMPT_ESQUEMA = """{{
   "titulo_proyecto": "Un título corto y descriptivo para la idea.",
   "resumen_ejecutivo": "Un párrafo de 2-4 frases resumiendo el análisis, incluyendo el veredicto final y la principal justificación.",
   "veredicto_ia": "Clasifica la idea en UNA de las siguientes categorías: 'Ideal para IA', 'Prometedor con Desafíos', 'Poco Práctico' o 'Inapropiado para IA'.",
@@ -105,17 +285,17 @@ El objeto JSON de salida debe seguir estrictamente la siguiente estructura:
     {{
       "titulo": "Análisis de Aspectos Técnicos Avanzados",
       "descripcion": "Explora en detalle los requerimientos técnicos específicos, infraestructura necesaria y posibles desafíos de implementación para este proyecto de IA.",
-      "consulta_completa": "Basado en el análisis anterior sobre '{problema_del_usuario}', profundiza en los aspectos técnicos: ¿qué tipo de modelos de IA serían más apropiados? ¿Qué volumen y calidad de datos se necesitan? ¿Qué infraestructura computacional requeriría? ¿Cuáles son los principales cuellos de botella técnicos y cómo superarlos?"
+      "consulta_completa": "Basado en el análisis anterior sobre '{p}', profundiza en los aspectos técnicos: ¿qué tipo de modelos de IA serían más apropiados? ¿Qué volumen y calidad de datos se necesitan? ¿Qué infraestructura computacional requeriría? ¿Cuáles son los principales cuellos de botella técnicos y cómo superarlos?"
     }},
     {{
       "titulo": "Evaluación Financiera y ROI Detallado",
       "descripcion": "Realiza un análisis financiero completo incluyendo costos de desarrollo, mantenimiento, retorno de inversión esperado y comparación con alternativas tradicionales.",
-      "consulta_completa": "Continuando con el proyecto '{problema_del_usuario}' analizado anteriormente, realiza una evaluación financiera detallada: calcula los costos estimados de desarrollo e implementación, estima los ahorros o ingresos adicionales generados, calcula el período de retorno de inversión, y compara con soluciones convencionales no basadas en IA."
+      "consulta_completa": "Continuando con el proyecto '{p}' analizado anteriormente, realiza una evaluación financiera detallada: calcula los costos estimados de desarrollo e implementación, estima los ahorros o ingresos adicionales generados, calcula el período de retorno de inversión, y compara con soluciones convencionales no basadas en IA."
     }},
     {{
       "titulo": "Estrategia de Implementación Paso a Paso",
       "descripcion": "Desarrolla un plan de implementación práctico con timeline, recursos necesarios y métricas de éxito para llevar este proyecto de IA a producción.",
-      "consulta_completa": "Para el proyecto '{problema_del_usuario}' que hemos evaluado, crea una estrategia de implementación detallada: define las fases del proyecto con timelines realistas, identifica los recursos humanos y tecnológicos necesarios, establece métricas de éxito cuantificables, y describe cómo medir y validar los resultados en cada etapa."
+      "consulta_completa": "Para el proyecto '{p}' que hemos evaluado, crea una estrategia de implementación detallada: define las fases del proyecto con timelines realistas, identifica los recursos humanos y tecnológicos necesarios, establece métricas de éxito cuantificables, y describe cómo medir y validar los resultados en cada etapa."
     }}
   ],
 
@@ -129,357 +309,832 @@ El objeto JSON de salida debe seguir estrictamente la siguiente estructura:
       Un entero del 1 al 10 para la Complejidad Técnica (donde 1 es extremadamente complejo y 10 es simple)
     ]
   }}
-}}
+}}"""
+
+_PROMPT_TEMPLATE = _PROMPT_INSTRUCCIONES + """
+
+PROBLEMA O PROYECTO A ANALIZAR: {p}
+
+El objeto JSON de salida debe seguir estrictamente la siguiente estructura:
+
+""" + _PROMPT_ESQUEMA + """
     """
-    return prompt
 
+# Variante para analizar varios problemas en una sola petición: {problemas} es la
+# lista numerada y {p} se sustituye por una referencia genérica al problema de cada análisis
+_PROMPT_TEMPLATE_LOTE = _PROMPT_INSTRUCCIONES + """
+
+PROBLEMAS O PROYECTOS A ANALIZAR (analiza cada uno de forma independiente):
+{problemas}
+
+El objeto JSON de salida debe tener una única clave "resultados" cuyo valor sea una lista con exactamente {n} análisis, uno por problema y en el mismo orden en que aparecen arriba.
+Cada análisis de la lista debe seguir estrictamente la siguiente estructura:
+
+""" + _PROMPT_ESQUEMA
+
+# Máximo de problemas por petición en lote: más análisis no caben en la salida del modelo
+TAMANO_LOTE_PROMPT = 5
+
+
+def _objeto(propiedades: dict) -> dict:
+    """Esquema de un objeto JSON cuyas propiedades son todas obligatorias."""
+    return {"type": "object", "properties": propiedades, "required": list(propiedades)}
+
+
+_TEXTO = {"type": "string"}
+_INDICE = _objeto({"puntuacion": {"type": "integer"}, "justificacion": _TEXTO})
+
+# Esquema de la respuesta, equivalente a la estructura descrita en _PROMPT_ESQUEMA.
+# Gemini lo usa para generar directamente JSON válido con esta forma.
+ESQUEMA_RESPUESTA = _objeto({
+    "titulo_proyecto": _TEXTO,
+    "resumen_ejecutivo": _TEXTO,
+    "veredicto_ia": {
+        "type": "string",
+        "enum": ["Ideal para IA", "Prometedor con Desafíos", "Poco Práctico", "Inapropiado para IA"],
+    },
+    "indices_clave": _objeto({
+        "adecuacion_ia": _INDICE,
+        "factibilidad_tecnica": _INDICE,
+        "impacto_potencial": _INDICE,
+    }),
+    "analisis_detallado": _objeto({
+        "justificacion_ia": _TEXTO,
+        "requisitos_y_desafios_tecnicos": _TEXTO,
+        "analisis_coste_beneficio": _TEXTO,
+        "alternativas_no_ia": _TEXTO,
+    }),
+    "recomendaciones_estrategicas": {"type": "array", "items": _TEXTO},
+    "consultas_relacionadas": {
+        "type": "array",
+        "items": _objeto({"titulo": _TEXTO, "descripcion": _TEXTO, "consulta_completa": _TEXTO}),
+    },
+    "datos_grafico_radar": _objeto({
+        "labels": {"type": "array", "items": _TEXTO},
+        "valoracion": {"type": "array", "items": {"type": "integer"}},
+    }),
+})
+
+# Esquema de la respuesta por lotes: la lista de análisis bajo la clave "resultados"
+ESQUEMA_RESPUESTA_LOTE = _objeto({"resultados": {"type": "array", "items": ESQUEMA_RESPUESTA}})
+
+# Tipos de Python aceptados para cada tipo del esquema (bool es subclase de int: se excluye aparte)
+_TIPOS_JSON = {"object": dict, "array": list, "string": str, "integer": (int, float)}
+
+
+def _compilar_validador(esquema: dict):
+    """
+    Convierte un esquema en una función que comprueba la forma de un valor.
 
-def analizar_viabilidad_con_cerebras(problema_usuario: str) -> dict:
+    La función devuelve None si el valor es válido, o la ruta del primer campo
+    con un tipo incorrecto. Solo se comprueban los campos presentes: las
+    plantillas toleran campos ausentes, pero no un objeto donde esperan una
+    lista (o al revés). El recorrido del esquema se hace una sola vez, aquí.
+    """
+    tipo = _TIPOS_JSON[esquema["type"]]
+    hijos = {}
+    if esquema["type"] == "object":
+        hijos = {campo: _compilar_validador(sub) for campo, sub in esquema["properties"].items()}
+    elementos = _compilar_validador(esquema["items"]) if esquema["type"] == "array" else None
+
+    def validar(valor, ruta="respuesta"):
+        if not isinstance(valor, tipo) or isinstance(valor, bool):
+            return ruta
+        for campo, validar_campo in hijos.items():
+            if campo in valor:
+                error = validar_campo(valor[campo], f"{ruta}.{campo}")
+                if error:
+                    return error
+        if elementos is not None:
+            for i, elemento in enumerate(valor):
+                error = elementos(elemento, f"{ruta}[{i}]")
+                if error:
+                    return error
+        return None
+
+    return validar
+
+
+_VALIDAR_RESPUESTA = _compilar_validador(ESQUEMA_RESPUESTA)
+
+
+def _validar_resultado(resultado, proveedor: str) -> dict:
+    """Devuelve el análisis si tiene la forma esperada, o un diccionario de error."""
+    campo_invalido = _VALIDAR_RESPUESTA(resultado)
+    if campo_invalido:
+        logger.warning("La respuesta de %s tiene un tipo inesperado en '%s'", proveedor, campo_invalido)
+        return {"error": f"La respuesta del modelo no tiene la estructura esperada (campo '{campo_invalido}')."}
+    return resultado
+
+
+@lru_cache(maxsize=1024)
+def _construir_prompt(problema: str) -> str:
     """
-    Función principal para interactuar con la API de Cerebras.
+    Interpola el problema (ya validado y sin espacios sobrantes) en la plantilla.
+
+    El prompt ocupa varios KB; las consultas repetidas (reintentos del usuario,
+    streaming tras un análisis normal, lotes) reutilizan el string ya construido.
+    """
+    return _PROMPT_TEMPLATE.format(p=problema)
 
-    Esta función maneja todo el proceso de comunicación con el modelo Cerebras,
-    incluyendo la generación del prompt, el envío de la solicitud, el procesamiento
-    de la respuesta y la extracción del JSON estructurado. Incluye validaciones
-    exhaustivas en cada paso para garantizar robustez.
+
+def disenar_prompt_robusto(problema_del_usuario: str) -> str:
+    """
+    Diseña un prompt sofisticado y crítico para que los modelos de IA analicen
+    la viabilidad de aplicar inteligencia artificial a un problema específico.
+
+    Este prompt está diseñado para obtener análisis realistas y pragmáticos,
+    enfocándose en costos, datos y alternativas, en lugar de ser excesivamente
+    optimista como lo hacen muchos análisis de IA.
 
     Parámetros:
-        problema_usuario: Descripción del problema o proyecto a analizar
+        problema_del_usuario: La descripción del problema o proyecto que se quiere analizar
 
     Retorna:
-        Diccionario con el análisis completo o un diccionario con clave "error" si falla
+        Un string con el prompt completo en español, listo para enviar a un modelo de IA
     """
-    # Verificación inicial de configuración antes de proceder
-    if not CEREBRAS_API_KEY:
-        return {"error": "API Key de Cerebras no configurada en el servidor."}
+    # Validación exhaustiva del input para evitar errores posteriores
+    # Es crítico validar aquí porque los modelos de IA pueden fallar de formas extrañas con inputs inválidos
+    if problema_del_usuario is None:
+        logger.warning("problema_del_usuario es None")
+        return None
+
+    if not isinstance(problema_del_usuario, str):
+        logger.warning("problema_del_usuario no es string, es %s", type(problema_del_usuario))
+        return None
 
+    problema_stripped = problema_del_usuario.strip()
+    if not problema_stripped:
+        logger.warning("problema_del_usuario está vacío después de strip")
+        return None
+
+    if len(problema_stripped) < 10:
+        logger.warning("problema_del_usuario es demasiado corto: %d caracteres", len(problema_stripped))
+        return None
+
+    # Construcción del prompt principal a partir de la plantilla precompilada
+    return _construir_prompt(problema_stripped)
+
+
+def _disenar_prompt_lote(problemas: list[str]) -> str:
+    """
+    Construye un único prompt que pide el análisis de varios problemas a la vez.
+
+    Los problemas deben estar ya validados (ver disenar_prompt_robusto).
+    """
+    lista = "\n".join(f"{i}. {problema.strip()}" for i, problema in enumerate(problemas, 1))
+    return _PROMPT_TEMPLATE_LOTE.format(problemas=lista, n=len(problemas), p="[texto del problema analizado]")
+
+
+def _generar_prompt(problema_usuario: str):
+    """
+    Genera el prompt de análisis y verifica que sea utilizable.
+
+    Centraliza las validaciones que comparten todas las variantes (síncronas y
+    asíncronas) de las funciones de análisis.
+
+    Retorna:
+        El prompt listo para enviar, o None si no se pudo generar
+    """
+    prompt_final = disenar_prompt_robusto(problema_usuario)
+
+    # Validación crítica del prompt generado - no podemos enviar algo inválido
+    if prompt_final is None:
+        logger.warning("disenar_prompt_robusto devolvió None")
+        return None
+
+    if not isinstance(prompt_final, str) or prompt_final.strip() == "":
+        logger.warning("prompt_final no es string válido: %s", type(prompt_final))
+        return None
+
+    return prompt_final
+
+
+def _parametros_cerebras(prompt_final: str) -> dict:
+    """
+    Construye los parámetros de la solicitud a Cerebras.
+
+    Se comparten entre el cliente síncrono y el asíncrono para que ambos
+    caminos envíen exactamente la misma petición.
+    """
+    # Logging para debugging - útil para ver qué se está enviando.
+    # Se comprueba el nivel antes para no formatear nada en producción
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Prompt final antes de enviar (%d caracteres): '%s...'", len(prompt_final), prompt_final[:500])
+
+    messages = [{"role": "user", "content": prompt_final}]
+
+    # Usamos el modelo Qwen instruct que es bueno para análisis estructurado
+    return {
+        "model": "qwen-3-235b-a22b-instruct-2507",  # Modelo específico de Cerebras para tareas instructivas
+        "messages": messages,  # Contiene el prompt como mensaje del usuario
+        # El JSON del análisis ronda los 1.500-2.500 tokens en español; 4096 deja margen
+        # para no truncarlo y acota el peor caso de decodificación (antes 20000).
+        # Revisar con la longitud de salida p99 medida en producción.
+        "max_tokens": 4096,
+        "temperature": 0.7,   # Balance entre creatividad y consistencia
+        "top_p": 0.8,         # Sampling nucleus para diversidad controlada
+        "stream": False,      # Respuesta completa, no streaming
+        "response_format": {"type": "json_object"},  # Obliga al modelo a devolver solo un objeto JSON
+    }
+
+
+@retry(retry=retry_if_exception_type(_ERRORES_TRANSITORIOS_CEREBRAS), **_POLITICA_REINTENTOS)
+def _llamar_cerebras(prompt_final: str, stream: bool = False):
+    """
+    Envía el prompt a Cerebras, reintentando ante errores transitorios.
+
+    Con stream=True devuelve un iterador de fragmentos; en ese caso solo se
+    reintenta el establecimiento de la llamada, no la lectura del stream.
+    """
+    # Cada intento (reintentos incluidos) consume un token del limitador
+    _LIMITADOR_CEREBRAS.adquirir()
+    parametros = _parametros_cerebras(prompt_final)
+    parametros["stream"] = stream
+    return _CLIENTE_CEREBRAS.chat.completions.create(**parametros)
+
+
+@retry(retry=retry_if_exception_type(_ERRORES_TRANSITORIOS_CEREBRAS), **_POLITICA_REINTENTOS)
+async def _llamar_cerebras_async(prompt_final: str, **opciones):
+    """
+    Variante asíncrona de _llamar_cerebras.
+
+    Las opciones adicionales (por ejemplo max_tokens en los lotes) sustituyen
+    a los parámetros por defecto de la petición.
+    """
+    await _LIMITADOR_CEREBRAS.adquirir_async()
+    parametros = _parametros_cerebras(prompt_final)
+    parametros.update(opciones)
+    return await _CLIENTE_CEREBRAS_ASYNC.chat.completions.create(**parametros)
+
+
+# Decodificador JSON reutilizable: raw_decode permite parsear un objeto que empieza
+# en cualquier posición del texto y nos dice dónde termina
+_JSON_DECODER = json.JSONDecoder()
+
+
+def _extraer_json_de_respuesta(texto: str):
+    """
+    Extrae el primer objeto JSON válido de una respuesta de un modelo de IA.
+
+    Ambos proveedores se configuran para devolver JSON estricto (response_format
+    en Cerebras, response_schema en Gemini), así que lo normal es que el texto
+    completo sea el objeto y baste con un orjson.loads. Como red de seguridad,
+    si el modelo añade texto alrededor del JSON probamos raw_decode desde cada
+    '{' hasta que uno produce un objeto completo.
+
+    Parámetros:
+        texto: Respuesta cruda del modelo
+
+    Retorna:
+        El diccionario encontrado, o None si el texto no contiene un objeto JSON válido
+    """
     try:
-        # Inicialización del cliente de Cerebras con la clave API
-        client = Cerebras(api_key=CEREBRAS_API_KEY)
+        resultado = orjson.loads(texto)
+        if isinstance(resultado, dict):
+            return resultado
+    except orjson.JSONDecodeError:
+        pass  # No es únicamente un objeto JSON; buscamos uno dentro del texto
+
+    idx = texto.find('{')
+    while idx != -1:
+        try:
+            resultado, _ = _JSON_DECODER.raw_decode(texto, idx)
+            return resultado
+        except json.JSONDecodeError:
+            # Este '{' no inicia un objeto válido; probamos con el siguiente
+            idx = texto.find('{', idx + 1)
+    return None
 
-        # Generación del prompt personalizado para este problema específico
-        prompt_final = disenar_prompt_robusto(problema_usuario)
 
-        # Validación crítica del prompt generado - no podemos enviar algo inválido
-        if prompt_final is None:
-            print("Error: disenar_prompt_robusto devolvió None")
-            return {"error": "Error interno al generar el prompt de análisis."}
+# Espacios en blanco permitidos entre tokens JSON
+_ESPACIOS = re.compile(r'\s*')
 
-        if not isinstance(prompt_final, str) or prompt_final.strip() == "":
-            print(f"Error: prompt_final no es string válido: {type(prompt_final)}")
-            return {"error": "Error interno al generar el prompt de análisis."}
 
-        # Logging para debugging - útil para ver qué se está enviando
-        print(f"Prompt final antes de enviar: '{prompt_final[:500]}...'")
-        print(f"Longitud del prompt: {len(prompt_final)}")
-
-        # Preparación del contenido para el mensaje
-        # En teoría siempre debería ser string, pero esta validación añade robustez
-        if isinstance(prompt_final, str):
-            content = prompt_final
-        else:
-            # Fallback por si acaso, aunque es muy improbable
-            content = str(prompt_final)
-
-        messages = [{"role": "user", "content": content}]
-        print(f"Content a enviar: '{content[:500]}...'")
-
-        # Envío de la solicitud a la API de Cerebras
-        # Usamos el modelo Qwen instruct que es bueno para análisis estructurado
-        response = client.chat.completions.create(
-            model="qwen-3-235b-a22b-instruct-2507",  # Modelo específico de Cerebras para tareas instructivas
-            messages=messages,  # Contiene el prompt como mensaje del usuario
-            max_tokens=20000,  # Límite alto para respuestas detalladas
-            temperature=0.7,   # Balance entre creatividad y consistencia
-            top_p=0.8,         # Sampling nucleus para diversidad controlada
-            stream=False       # Respuesta completa, no streaming
-        )
+class _ParserJSONIncremental:
+    """
+    Parser que recibe el JSON por fragmentos y entrega cada campo de primer nivel
+    en cuanto está completo.
+
+    Permite mostrar al usuario el título, el resumen o el veredicto mientras el
+    modelo sigue generando el resto del análisis. No valida el documento entero:
+    el resultado final se sigue obteniendo parseando la respuesta completa.
+    """
 
-        # Validación exhaustiva de la respuesta - las APIs pueden fallar de formas inesperadas
-        print(f"Tipo de response: {type(response)}")
-        print(f"Response tiene atributo choices: {hasattr(response, 'choices')}")
-
-        if not response:
-            print("Respuesta de Cerebras es None")
-            print(f"Tipo esperado de response: {type(response)}")
-            return {"error": "La API de Cerebras no devolvió una respuesta válida."}
-
-        if not hasattr(response, 'choices'):
-            print("Respuesta de Cerebras no tiene atributo 'choices'")
-            print(f"Atributos disponibles: {[attr for attr in dir(response) if not attr.startswith('_')]}")
-            return {"error": "La respuesta de Cerebras no tiene la estructura esperada (falta choices)."}
-
-        if not response.choices:
-            print("Respuesta de Cerebras tiene choices vacío")
-            print(f"Response completo: {response}")
-            return {"error": "La respuesta de Cerebras no contiene opciones válidas."}
-
-        print(f"Número de choices: {len(response.choices)}")
-
-        first_choice = response.choices[0]
-        print(f"Tipo de first_choice: {type(first_choice)}")
-        print(f"First_choice es None: {first_choice is None}")
-
-        if first_choice is None:
-            print("La primera choice es None")
-            return {"error": "La primera opción de respuesta de Cerebras es None."}
-
-        if not hasattr(first_choice, 'message'):
-            print("First_choice no tiene atributo 'message'")
-            print(f"Atributos de first_choice: {[attr for attr in dir(first_choice) if not attr.startswith('_')]}")
-            return {"error": "La respuesta de Cerebras no contiene un mensaje válido."}
-
-        message = first_choice.message
-        print(f"Tipo de message: {type(message)}")
-        print(f"Message es None: {message is None}")
-
-        if message is None:
-            print("El message es None")
-            return {"error": "El mensaje de respuesta de Cerebras es None."}
-
-        if not hasattr(message, 'content'):
-            print("Message no tiene atributo 'content'")
-            print(f"Atributos de message: {[attr for attr in dir(message) if not attr.startswith('_')]}")
-            return {"error": "El mensaje de Cerebras no contiene contenido."}
-
-        # Extraemos y analizamos el contenido de la respuesta - paso crítico
-        raw_content = message.content
-        print(f"Respuesta cruda de Cerebras: '{raw_content}'")
-        print(f"Tipo de respuesta: {type(raw_content)}")
-        print(f"Longitud de la respuesta: {len(raw_content) if raw_content else 0}")
-        print(f"Primeros 200 caracteres: '{raw_content[:200] if raw_content else 'None'}'")
-        print(f"Últimos 200 caracteres: '{raw_content[-200:] if raw_content else 'None'}'")
-        print(f"Contiene '{{' : {'{{' in raw_content if raw_content else False}")
-        print(f"Contiene '}}' : {'}}' in raw_content if raw_content else False}")
-
-        # Verificaciones finales antes de procesar el JSON
-        if raw_content is None:
-            print("La respuesta de Cerebras es None")
-            return {"error": "La respuesta del modelo es None. Verifica la configuración de la API o intenta nuevamente."}
-
-        if not isinstance(raw_content, str) or raw_content.strip() == "":
-            print(f"La respuesta de Cerebras está vacía o no es string: {type(raw_content)}")
-            return {"error": "La respuesta del modelo está vacía. Intente nuevamente con una consulta más específica."}
-
-        # Función especializada para extraer JSON válido de respuestas de modelos de IA
-        # Los modelos pueden devolver texto adicional o JSON malformado
-        def extraer_json_de_respuesta(texto):
-            import re
-            # Estrategia de extracción robusta: múltiples intentos para encontrar JSON válido
-            texto = texto.strip()
-
-            # Primer intento: si el texto completo ya es JSON válido
+    def __init__(self):
+        self._buffer = ""
+        self._pos = None  # Posición desde la que seguir leyendo; None hasta ver el '{' inicial
+        self.terminado = False
+
+    def _saltar_espacios(self, pos: int) -> int:
+        return _ESPACIOS.match(self._buffer, pos).end()
+
+    def alimentar(self, fragmento: str) -> list:
+        """
+        Añade un fragmento de texto y devuelve los pares (clave, valor) que se
+        han completado con él, en el orden en que aparecen en el JSON.
+        """
+        self._buffer += fragmento
+        completados = []
+
+        if self._pos is None:
+            inicio = self._buffer.find('{')
+            if inicio == -1:
+                return completados
+            self._pos = inicio + 1
+
+        while not self.terminado:
+            pos = self._saltar_espacios(self._pos)
+            if pos >= len(self._buffer):
+                break
+            if self._buffer[pos] == ',':
+                self._pos = pos + 1
+                continue
+            if self._buffer[pos] == '}':
+                self.terminado = True
+                break
+
+            # Clave: un string JSON seguido de ':'
             try:
-                return json.loads(texto)
+                clave, fin_clave = _JSON_DECODER.raw_decode(self._buffer, pos)
             except json.JSONDecodeError:
-                pass
-
-            # Segundo intento: buscar patrones JSON con expresiones regulares
-            json_objects = re.findall(r'\{.*\}', texto, re.DOTALL)
-
-            for obj in json_objects:
-                try:
-                    balanced = balancear_llaves(obj)
-                    if balanced:
-                        return json.loads(balanced)
-                except json.JSONDecodeError:
-                    continue
-
-            # Tercer intento: extracción manual balanceando llaves
-            start = texto.find('{')
-            if start == -1:
-                return None
-
-            brace_count = 0
-            end = start
-            for i, char in enumerate(texto[start:], start):
-                if char == '{':
-                    brace_count += 1
-                elif char == '}':
-                    brace_count -= 1
-                    if brace_count == 0:
-                        end = i
-                        break
-
-            if brace_count == 0 and end > start:
-                json_candidate = texto[start:end+1]
-                try:
-                    return json.loads(json_candidate)
-                except json.JSONDecodeError:
-                    pass
-
-            return None
-
-        # Función auxiliar para balancear llaves en JSON
-        def balancear_llaves(texto):
-            brace_count = 0
-            start = texto.find('{')
-            if start == -1:
-                return None
-
-            for i in range(start, len(texto)):
-                if texto[i] == '{':
-                    brace_count += 1
-                elif texto[i] == '}':
-                    brace_count -= 1
-                    if brace_count == 0:
-                        return texto[start:i+1]
-            return None
-
-        # Último paso: extraer el JSON estructurado de la respuesta del modelo
-        resultado_dict = extraer_json_de_respuesta(raw_content)
+                break  # Clave incompleta: esperamos al siguiente fragmento
+            pos = self._saltar_espacios(fin_clave)
+            if pos >= len(self._buffer):
+                break
+            if not isinstance(clave, str) or self._buffer[pos] != ':':
+                # No es un objeto JSON bien formado; dejamos el error al parseo final
+                self.terminado = True
+                break
+
+            # Valor: cualquier valor JSON completo
+            try:
+                valor, fin_valor = _JSON_DECODER.raw_decode(self._buffer, self._saltar_espacios(pos + 1))
+            except json.JSONDecodeError:
+                break  # Valor incompleto: esperamos al siguiente fragmento
+            # Un número al final del buffer aún puede crecer; solo lo damos por
+            # cerrado cuando aparece el separador siguiente
+            if self._saltar_espacios(fin_valor) >= len(self._buffer):
+                break
 
-        if resultado_dict is None:
-            print(f"No se pudo extraer JSON válido de: '{raw_content}'")
-            return {"error": "La respuesta del modelo no contiene un JSON válido. El modelo puede no estar siguiendo las instrucciones correctamente."}
+            completados.append((clave, valor))
+            self._pos = fin_valor
 
-        return resultado_dict
+        return completados
 
-    except json.JSONDecodeError as e:
-        print(f"Error al parsear JSON de la API de Cerebras: {e}")
-        return {"error": f"La respuesta del modelo no es un JSON válido. Detalles: {str(e)}"}
-    except Exception as e:
-        print(f"Error al llamar a la API de Cerebras o al procesar su respuesta: {e}")
-        print(f"Tipo de excepción: {type(e)}")
-        import traceback
-        print("Traceback completo:")
-        traceback.print_exc()
-        return {"error": f"No se pudo obtener una respuesta del modelo de IA. Detalles: {str(e)}"}
 
+def _procesar_respuesta_cerebras(response) -> dict:
+    """
+    Valida la respuesta de Cerebras y extrae el JSON estructurado.
 
-def analizar_viabilidad_con_gemini(problema_usuario: str) -> dict:
+    Retorna:
+        Diccionario con el análisis o un diccionario con clave "error"
     """
-    Función que maneja la interacción completa con la API de Google Gemini.
+    # Accedemos directamente al contenido: si la respuesta no tiene la estructura
+    # esperada (None, sin choices, sin mensaje...) la excepción lo indica
+    try:
+        raw_content = response.choices[0].message.content
+    except (AttributeError, IndexError, TypeError):
+        logger.exception("La respuesta de Cerebras no tiene la estructura esperada")
+        return {"error": "La respuesta de Cerebras no tiene la estructura esperada."}
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Respuesta cruda de Cerebras (%s, %d caracteres): '%s'",
+            type(raw_content), len(raw_content) if raw_content else 0, raw_content,
+        )
+
+    # Única verificación previa al JSON: que haya contenido
+    if not isinstance(raw_content, str) or raw_content.strip() == "":
+        logger.warning("La respuesta de Cerebras está vacía o no es string: %s", type(raw_content))
+        return {"error": "La respuesta del modelo está vacía. Intente nuevamente con una consulta más específica."}
+
+    # Último paso: extraer el JSON estructurado de la respuesta del modelo
+    resultado_dict = _extraer_json_de_respuesta(raw_content)
+
+    if resultado_dict is None:
+        logger.warning("No se pudo extraer JSON válido de la respuesta de Cerebras: '%s'", raw_content[:500])
+        return {"error": "La respuesta del modelo no contiene un JSON válido. El modelo puede no estar siguiendo las instrucciones correctamente."}
+
+    return _validar_resultado(resultado_dict, "Cerebras")
 
-    Similar a la función de Cerebras, pero adaptada a la estructura específica
-    de la API de Gemini que tiene diferencias significativas en cómo se manejan
-    las respuestas y configuraciones.
+
+def _obtener_api_key_gemini():
+    """Devuelve la clave de Gemini (soporta dos nombres de variable) o None."""
+    return os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
+
+
+def _crear_modelo_gemini(api_key: str):
+    """
+    Configura la biblioteca de Google y construye el modelo de Gemini.
 
     Parámetros:
-        problema_usuario: Descripción del problema a analizar
+        api_key: Clave de la API de Gemini
 
     Retorna:
-        Diccionario con el análisis estructurado o diccionario de error
+        Instancia de genai.GenerativeModel lista para generar contenido
+    """
+    # Configuración inicial de la biblioteca de Google
+    genai.configure(api_key=api_key)
+
+    # Configuración especial para forzar salida JSON pura
+    # Esto es crucial para obtener respuestas estructuradas consistentes
+    generation_config = types.GenerationConfig(
+        response_mime_type="application/json",
+        response_schema=ESQUEMA_RESPUESTA,  # Estructura exacta del análisis
+        # Nota: Gemini 2.5 Flash tiene capacidades nativas de razonamiento,
+        # pero el prompt estructurado sigue siendo fundamental para consistencia
+    )
+
+    # Inicialización del modelo con configuración específica
+    return genai.GenerativeModel(
+        model_name="gemini-2.5-flash",  # Versión más reciente y capaz de Gemini
+        generation_config=generation_config,
+    )
+
+
+@lru_cache(maxsize=1)
+def _obtener_modelo_gemini(api_key: str):
+    """
+    Devuelve el modelo de Gemini compartido, creándolo en la primera llamada.
+
+    genai.configure y GenerativeModel preparan el transporte de red, así que
+    no tiene sentido repetirlos en cada análisis. La caché va indexada por la
+    clave API para que un cambio de clave construya un modelo nuevo.
+    """
+    return _crear_modelo_gemini(api_key)
+
+
+@retry(retry=retry_if_exception_type(_ERRORES_TRANSITORIOS_GEMINI), **_POLITICA_REINTENTOS)
+def _llamar_gemini(model, prompt_final: str, stream: bool = False, **opciones):
+    """
+    Genera la respuesta de Gemini, reintentando ante errores transitorios.
+
+    Con stream=True devuelve un iterador de fragmentos (ver _llamar_cerebras).
+    Las opciones adicionales (por ejemplo generation_config) se pasan tal cual
+    a generate_content.
+    """
+    _LIMITADOR_GEMINI.adquirir()
+    return model.generate_content(prompt_final, stream=stream, **opciones)
+
+
+# Hilos dedicados a las llamadas síncronas de Gemini desde código asíncrono
+_EJECUTOR_GEMINI = ThreadPoolExecutor(max_workers=16, thread_name_prefix="gemini")
+
+
+async def _llamar_gemini_async(model, prompt_final: str, **opciones):
+    """
+    Variante asíncrona de _llamar_gemini.
+
+    generate_content_async usa un canal gRPC asíncrono que queda ligado al event
+    loop en el que se usó por primera vez, y el modelo se comparte entre llamadas
+    que pueden venir de loops distintos (cada asyncio.run crea uno). Por eso se
+    ejecuta la llamada síncrona, con sus reintentos y su limitador, en un hilo del
+    ejecutor: el event loop queda libre para solapar otras esperas de red.
     """
-    # Verificación de credenciales para Gemini (soporta dos nombres de variable)
-    api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
-    if not api_key:
-        return {"error": "API Key de Gemini no configurada en el servidor."}
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _EJECUTOR_GEMINI, functools.partial(_llamar_gemini, model, prompt_final, **opciones)
+    )
 
+
+def _procesar_respuesta_gemini(response) -> dict:
+    """
+    Valida la respuesta de Gemini y la convierte en diccionario.
+
+    Retorna:
+        Diccionario con el análisis o un diccionario con clave "error"
+    """
+    # Extracción del texto de respuesta. response.text es el acceso habitual, pero
+    # lanza ValueError si la respuesta no tiene partes de texto simples; en ese
+    # caso probamos la estructura candidates/parts
     try:
-        # Configuración inicial de la biblioteca de Google
-        genai.configure(api_key=api_key)
-
-        # Configuración especial para forzar salida JSON pura
-        # Esto es crucial para obtener respuestas estructuradas consistentes
-        generation_config = types.GenerationConfig(
-            response_mime_type="application/json",
-            # Nota: Gemini 2.5 Flash tiene capacidades nativas de razonamiento,
-            # pero el prompt estructurado sigue siendo fundamental para consistencia
-        )
+        raw_content = response.text
+    except (AttributeError, ValueError):
+        try:
+            raw_content = response.candidates[0].content.parts[0].text
+        except (AttributeError, IndexError, TypeError):
+            logger.exception("No se pudo extraer texto de la respuesta de Gemini")
+            return {"error": "La respuesta de Gemini no contiene texto válido en ningún formato esperado."}
 
-        # Inicialización del modelo con configuración específica
-        model = genai.GenerativeModel(
-            model_name="gemini-2.5-flash",  # Versión más reciente y capaz de Gemini
-            generation_config=generation_config,
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Respuesta Gemini cruda (%s, %d caracteres): '%s...'",
+            type(raw_content), len(raw_content) if raw_content else 0, str(raw_content)[:500],
         )
 
-        prompt_final = disenar_prompt_robusto(problema_usuario)
+    # Cargar la respuesta de texto en un diccionario de Python
+    # Un texto vacío o inválido se detecta aquí mismo como JSON no válido
+    try:
+        # orjson.JSONDecodeError es subclase de json.JSONDecodeError
+        resultado_dict = orjson.loads(raw_content)
+    except (json.JSONDecodeError, TypeError) as e:
+        logger.warning("Error al parsear JSON de Gemini: %s. Contenido: '%s...'", e, str(raw_content)[:500])
+        return {"error": f"La respuesta del modelo no es un JSON válido. Detalles: {str(e)}"}
+
+    return _validar_resultado(resultado_dict, "Gemini")
+
+
+# El modelo compartido fuerza el esquema de un solo análisis; los lotes lo sustituyen por el suyo
+_CONFIG_GEMINI_LOTE = types.GenerationConfig(
+    response_mime_type="application/json",
+    response_schema=ESQUEMA_RESPUESTA_LOTE,
+)
+
+
+class Proveedor(Protocol):
+    """
+    Interfaz común de los proveedores de IA.
+
+    Cada proveedor solo sabe hablar con su API y leer su formato de respuesta;
+    la validación del prompt, la caché, la deduplicación de llamadas y el manejo
+    de errores viven una sola vez en _analizar / _analizar_async. Los reintentos
+    y el limitador de tasa van dentro de las funciones _llamar_* que usan.
+    Añadir un proveedor consiste en implementar esta interfaz y registrarlo en
+    _PROVEEDORES.
+    """
+
+    nombre: str  # Identificador usado en la caché y en el formulario ('cerebras', 'gemini')
+    etiqueta: str  # Nombre legible para los registros
+
+    def configurado(self) -> bool:
+        """Indica si la clave API del proveedor está disponible."""
+
+    def llamar(self, prompt_final: str):
+        """Envía el prompt y devuelve la respuesta cruda del SDK."""
+
+    async def llamar_async(self, prompt_final: str):
+        """Variante asíncrona de llamar."""
+
+    def procesar(self, response) -> dict:
+        """Convierte la respuesta cruda en el diccionario del análisis (o de error)."""
+
+    def fragmentos(self, prompt_final: str):
+        """Genera el texto de la respuesta por fragmentos (streaming)."""
+
+    async def llamar_lote_async(self, prompt_final: str, n: int, timeout: float) -> str:
+        """Envía un prompt por lotes de n problemas y devuelve el texto de la respuesta."""
+
+
+class _ProveedorCerebras:
+    """Proveedor de análisis sobre la API de Cerebras."""
+
+    nombre = 'cerebras'
+    etiqueta = 'Cerebras'
+
+    def configurado(self) -> bool:
+        return bool(CEREBRAS_API_KEY)
+
+    def llamar(self, prompt_final: str):
+        return _llamar_cerebras(prompt_final)
+
+    async def llamar_async(self, prompt_final: str):
+        return await _llamar_cerebras_async(prompt_final)
+
+    def procesar(self, response) -> dict:
+        return _procesar_respuesta_cerebras(response)
+
+    def fragmentos(self, prompt_final: str):
+        for chunk in _llamar_cerebras(prompt_final, stream=True):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def llamar_lote_async(self, prompt_final: str, n: int, timeout: float) -> str:
+        # Cada análisis del lote necesita su propio margen de tokens
+        max_tokens = _parametros_cerebras(prompt_final)["max_tokens"] * n
+        response = await _llamar_cerebras_async(prompt_final, max_tokens=max_tokens, timeout=timeout)
+        return response.choices[0].message.content
+
+
+class _ProveedorGemini:
+    """Proveedor de análisis sobre la API de Google Gemini."""
+
+    nombre = 'gemini'
+    etiqueta = 'Gemini'
+
+    def configurado(self) -> bool:
+        return bool(_obtener_api_key_gemini())
+
+    def _modelo(self):
+        return _obtener_modelo_gemini(_obtener_api_key_gemini())
 
-        # Validar que el prompt se generó correctamente
+    def llamar(self, prompt_final: str):
+        return _llamar_gemini(self._modelo(), prompt_final)
+
+    async def llamar_async(self, prompt_final: str):
+        return await _llamar_gemini_async(self._modelo(), prompt_final)
+
+    def procesar(self, response) -> dict:
+        return _procesar_respuesta_gemini(response)
+
+    def fragmentos(self, prompt_final: str):
+        for chunk in _llamar_gemini(self._modelo(), prompt_final, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+    async def llamar_lote_async(self, prompt_final: str, n: int, timeout: float) -> str:
+        response = await _llamar_gemini_async(self._modelo(), prompt_final, generation_config=_CONFIG_GEMINI_LOTE)
+        return response.text
+
+
+# Registro de proveedores disponibles, indexado por el nombre que elige el usuario
+_PROVEEDORES = {proveedor.nombre: proveedor for proveedor in (_ProveedorCerebras(), _ProveedorGemini())}
+
+
+def _analizar(proveedor: Proveedor, problema_usuario: str) -> dict:
+    """
+    Flujo completo de un análisis con cualquier proveedor.
+
+    Verifica la configuración, consulta la caché, genera el prompt, llama al
+    proveedor (compartiendo la llamada con consultas idénticas en curso),
+    procesa la respuesta y guarda el resultado en caché.
+
+    Retorna:
+        Diccionario con el análisis completo o un diccionario con clave "error" si falla
+    """
+    # Verificación inicial de configuración antes de proceder
+    if not proveedor.configurado():
+        return {"error": f"API Key de {proveedor.etiqueta} no configurada en el servidor."}
+
+    # Si ya analizamos este mismo problema, evitamos la llamada a la API
+    clave = _clave_cache(proveedor.nombre, problema_usuario)
+    cacheado = _leer_cache(clave)
+    if cacheado is not None:
+        return cacheado
+
+    try:
+        # Generación del prompt personalizado para este problema específico
+        prompt_final = _generar_prompt(problema_usuario)
         if prompt_final is None:
-            print("Error: disenar_prompt_robusto devolvió None")
             return {"error": "Error interno al generar el prompt de análisis."}
 
-        if not isinstance(prompt_final, str) or prompt_final.strip() == "":
-            print(f"Error: prompt_final no es string válido: {type(prompt_final)}")
-            return {"error": "Error interno al generar el prompt de análisis."}
+        # Las consultas idénticas concurrentes comparten una sola llamada
+        response = _deduplicar(clave, lambda: proveedor.llamar(prompt_final))
 
-        print(f"Prompt para Gemini: '{prompt_final[:500]}...'")
-        print(f"Longitud del prompt Gemini: {len(prompt_final)}")
-
-        # Generación de respuesta usando el modelo configurado
-        response = model.generate_content(prompt_final)
-
-        # Validación exhaustiva de la respuesta de Gemini - su estructura es diferente a Cerebras
-        print(f"Tipo de response Gemini: {type(response)}")
-        print(f"Response Gemini es None: {response is None}")
-
-        if not response:
-            print("Respuesta de Gemini es None o falsy")
-            print(f"Valor de response: {response}")
-            return {"error": "La API de Gemini no devolvió una respuesta válida."}
-
-        print(f"Atributos disponibles en response Gemini: {[attr for attr in dir(response) if not attr.startswith('_')]}")
-
-        # Gemini tiene múltiples formas de acceder al texto, necesitamos verificar todas
-        if hasattr(response, 'text'):
-            print(f"Response tiene atributo text: {response.text is not None}")
-        else:
-            print("Response NO tiene atributo text")
-
-        # Verificación de la estructura candidates (forma principal de Gemini)
-        if hasattr(response, 'candidates'):
-            print(f"Response tiene candidates: {len(response.candidates) if response.candidates else 0}")
-            if response.candidates:
-                print(f"Primer candidate tipo: {type(response.candidates[0])}")
-                if hasattr(response.candidates[0], 'content'):
-                    print(f"Primer candidate tiene content: {response.candidates[0].content}")
-                    if hasattr(response.candidates[0].content, 'parts'):
-                        print(f"Content tiene parts: {len(response.candidates[0].content.parts) if response.candidates[0].content.parts else 0}")
-        else:
-            print("Response NO tiene atributo candidates")
-
-        # Extracción del texto de respuesta - Gemini tiene estructura más compleja que Cerebras
-        raw_content = None
-
-        # Primer método: acceso directo al atributo text (forma más simple)
-        if hasattr(response, 'text') and response.text:
-            raw_content = response.text
-            print("Texto extraído del atributo 'text'")
-
-        # Segundo método: navegación por la estructura candidates/parts (forma estándar de Gemini)
-        elif hasattr(response, 'candidates') and response.candidates and len(response.candidates) > 0:
-            candidate = response.candidates[0]
-            if hasattr(candidate, 'content') and candidate.content:
-                if hasattr(candidate.content, 'parts') and candidate.content.parts and len(candidate.content.parts) > 0:
-                    part = candidate.content.parts[0]
-                    if hasattr(part, 'text') and part.text:
-                        raw_content = part.text
-                        print("Texto extraído de candidates[0].content.parts[0].text")
-
-        if raw_content is None:
-            print("No se pudo extraer texto de la respuesta de Gemini")
-            print(f"Response completo: {response}")
-            return {"error": "La respuesta de Gemini no contiene texto válido en ningún formato esperado."}
+        resultado_dict = proveedor.procesar(response)
+        _guardar_cache(clave, resultado_dict)
+        return resultado_dict
 
-        print(f"Respuesta Gemini cruda: '{raw_content[:500]}...'")
-        print(f"Tipo de respuesta Gemini: {type(raw_content)}")
-        print(f"Longitud de respuesta Gemini: {len(raw_content) if raw_content else 0}")
+    except json.JSONDecodeError as e:
+        logger.warning("Error al parsear JSON de la API de %s: %s", proveedor.etiqueta, e)
+        return {"error": f"La respuesta del modelo no es un JSON válido. Detalles: {str(e)}"}
+    except Exception as e:
+        # logger.exception incluye el traceback completo en el registro
+        logger.exception("Error al llamar a la API de %s o al procesar su respuesta", proveedor.etiqueta)
+        return {"error": f"No se pudo obtener una respuesta del modelo de IA. Detalles: {str(e)}"}
 
-        # Verificar si el texto está vacío
-        if not isinstance(raw_content, str) or raw_content.strip() == "":
-            print("La respuesta de Gemini está vacía o no es string")
-            return {"error": "La respuesta del modelo de Gemini está vacía."}
 
-        # Cargar la respuesta de texto en un diccionario de Python
-        try:
-            resultado_dict = json.loads(raw_content)
-        except json.JSONDecodeError as e:
-            print(f"Error al parsear JSON de Gemini: {e}")
-            print(f"Contenido que falló: '{raw_content[:500]}...'")
-            return {"error": f"La respuesta del modelo no es un JSON válido. Detalles: {str(e)}"}
+async def _analizar_async(proveedor: Proveedor, problema_usuario: str) -> dict:
+    """
+    Variante asíncrona de _analizar.
 
+    Cada llamada está acotada por TIMEOUT_LLM_SEGUNDOS.
+    """
+    if not proveedor.configurado():
+        return {"error": f"API Key de {proveedor.etiqueta} no configurada en el servidor."}
+
+    clave = _clave_cache(proveedor.nombre, problema_usuario)
+    cacheado = _leer_cache(clave)
+    if cacheado is not None:
+        return cacheado
+
+    try:
+        prompt_final = _generar_prompt(problema_usuario)
+        if prompt_final is None:
+            return {"error": "Error interno al generar el prompt de análisis."}
+
+        response = await asyncio.wait_for(
+            _deduplicar_async(clave, lambda: proveedor.llamar_async(prompt_final)),
+            timeout=TIMEOUT_LLM_SEGUNDOS,
+        )
+
+        resultado_dict = proveedor.procesar(response)
+        _guardar_cache(clave, resultado_dict)
         return resultado_dict
 
+    except asyncio.TimeoutError:
+        logger.warning("Timeout de %ss esperando a la API de %s", TIMEOUT_LLM_SEGUNDOS, proveedor.etiqueta)
+        return {"error": f"El modelo de IA no respondió en {TIMEOUT_LLM_SEGUNDOS} segundos. Intenta nuevamente."}
     except json.JSONDecodeError as e:
-        print(f"Error al parsear JSON de la API de Gemini: {e}")
+        logger.warning("Error al parsear JSON de la API de %s: %s", proveedor.etiqueta, e)
         return {"error": f"La respuesta del modelo no es un JSON válido. Detalles: {str(e)}"}
     except Exception as e:
-        print(f"Error al llamar a la API de Gemini o al procesar su respuesta: {e}")
+        logger.exception("Error al llamar a la API de %s o al procesar su respuesta", proveedor.etiqueta)
         return {"error": f"No se pudo obtener una respuesta del modelo de IA. Detalles: {str(e)}"}
 
 
+def analizar_viabilidad_con_cerebras(problema_usuario: str) -> dict:
+    """
+    Analiza la viabilidad de un problema con el modelo de Cerebras.
+
+    Parámetros:
+        problema_usuario: Descripción del problema o proyecto a analizar
+
+    Retorna:
+        Diccionario con el análisis completo o un diccionario con clave "error" si falla
+    """
+    return _analizar(_PROVEEDORES['cerebras'], problema_usuario)
+
+
+async def analizar_viabilidad_con_cerebras_async(problema_usuario: str) -> dict:
+    """
+    Variante asíncrona de analizar_viabilidad_con_cerebras.
+
+    Usa el cliente AsyncCerebras compartido para que varias consultas puedan
+    esperar la red al mismo tiempo en lugar de bloquear el hilo una tras otra.
+    """
+    return await _analizar_async(_PROVEEDORES['cerebras'], problema_usuario)
+
+
+def analizar_viabilidad_con_gemini(problema_usuario: str) -> dict:
+    """
+    Analiza la viabilidad de un problema con el modelo de Google Gemini.
+
+    Parámetros:
+        problema_usuario: Descripción del problema a analizar
+
+    Retorna:
+        Diccionario con el análisis estructurado o diccionario de error
+    """
+    return _analizar(_PROVEEDORES['gemini'], problema_usuario)
+
+
+async def analizar_viabilidad_con_gemini_async(problema_usuario: str) -> dict:
+    """
+    Variante asíncrona de analizar_viabilidad_con_gemini.
+
+    Ejecuta la llamada a Gemini en un hilo aparte para no bloquear el event
+    loop mientras responde.
+    """
+    return await _analizar_async(_PROVEEDORES['gemini'], problema_usuario)
+
+
+def analizar_viabilidad_stream(model: str, problema_usuario: str):
+    """
+    Variante en streaming de analizar_viabilidad.
+
+    En lugar de esperar a la respuesta completa, genera eventos a medida que el
+    modelo produce el JSON, para que la interfaz pueda ir mostrando el análisis:
+
+        ("campo", {"clave": ..., "valor": ...})  por cada campo de primer nivel completado
+        ("resultado", dict)                       al final, con el análisis completo
+        ("error", {"error": ...})                 si algo falla (termina el stream)
+
+    Parámetros:
+        model: Nombre del modelo a usar ('gemini' o 'cerebras')
+        problema_usuario: Descripción del problema o proyecto a analizar
+    """
+    proveedor = _PROVEEDORES.get(model)
+    if proveedor is None:
+        yield "error", {"error": "Modelo no soportado. Usa 'gemini' o 'cerebras'."}
+        return
+    if not proveedor.configurado():
+        yield "error", {"error": f"API Key de {proveedor.etiqueta} no configurada en el servidor."}
+        return
+
+    # Un análisis cacheado se emite de golpe con la misma secuencia de eventos
+    clave = _clave_cache(model, problema_usuario)
+    cacheado = _leer_cache(clave)
+    if cacheado is not None:
+        for campo, valor in cacheado.items():
+            yield "campo", {"clave": campo, "valor": valor}
+        yield "resultado", cacheado
+        return
+
+    prompt_final = _generar_prompt(problema_usuario)
+    if prompt_final is None:
+        yield "error", {"error": "Error interno al generar el prompt de análisis."}
+        return
+
+    try:
+        parser = _ParserJSONIncremental()
+        partes = []
+        for fragmento in proveedor.fragmentos(prompt_final):
+            partes.append(fragmento)
+            for campo, valor in parser.alimentar(fragmento):
+                yield "campo", {"clave": campo, "valor": valor}
+
+        # El resultado definitivo sale de la respuesta completa, igual que sin streaming
+        texto_completo = "".join(partes)
+        resultado_dict = _extraer_json_de_respuesta(texto_completo)
+        if resultado_dict is None:
+            logger.warning("No se pudo extraer JSON válido de la respuesta en streaming: '%s'", texto_completo[:500])
+            yield "error", {"error": "La respuesta del modelo no contiene un JSON válido. El modelo puede no estar siguiendo las instrucciones correctamente."}
+            return
+
+        resultado_dict = _validar_resultado(resultado_dict, proveedor.etiqueta)
+        if "error" in resultado_dict:
+            yield "error", resultado_dict
+            return
+
+        _guardar_cache(clave, resultado_dict)
+        yield "resultado", resultado_dict
+
+    except Exception as e:
+        logger.exception("Error durante el análisis en streaming con %s", model)
+        yield "error", {"error": f"No se pudo obtener una respuesta del modelo de IA. Detalles: {str(e)}"}
+
+
 def analizar_viabilidad(model: str, problema_usuario: str) -> dict:
     """
     Función principal y unificada para análisis de viabilidad usando IA.
@@ -501,4 +1156,129 @@ def analizar_viabilidad(model: str, problema_usuario: str) -> dict:
     elif model == 'cerebras':
         return analizar_viabilidad_con_cerebras(problema_usuario)
     else:
-        return {"error": "Modelo no soportado. Usa 'gemini' o 'cerebras'."}
\ No newline at end of file
+        return {"error": "Modelo no soportado. Usa 'gemini' o 'cerebras'."}
+
+
+async def analizar_viabilidad_async(model: str, problema_usuario: str) -> dict:
+    """
+    Punto de entrada asíncrono equivalente a analizar_viabilidad.
+
+    Pensado para vistas ASGI o tareas que necesitan lanzar varios análisis
+    a la vez con asyncio.gather.
+
+    Parámetros:
+        model: Nombre del modelo a usar ('gemini' o 'cerebras')
+        problema_usuario: Descripción del problema o proyecto a analizar
+
+    Retorna:
+        Diccionario con el análisis completo o mensaje de error
+    """
+    if model == 'gemini':
+        return await analizar_viabilidad_con_gemini_async(problema_usuario)
+    elif model == 'cerebras':
+        return await analizar_viabilidad_con_cerebras_async(problema_usuario)
+    else:
+        return {"error": "Modelo no soportado. Usa 'gemini' o 'cerebras'."}
+
+
+async def _analizar_lote_async(model: str, problemas: list[str]):
+    """
+    Analiza varios problemas con una sola petición al modelo.
+
+    Retorna:
+        Lista de diccionarios en el mismo orden que problemas, o None si la
+        respuesta no se pudo interpretar (el llamador analiza entonces uno a uno)
+    """
+    prompt_final = _disenar_prompt_lote(problemas)
+    # Cada análisis necesita su propio margen de tiempo y de tokens
+    timeout = TIMEOUT_LLM_SEGUNDOS * len(problemas)
+
+    try:
+        texto = await asyncio.wait_for(
+            _PROVEEDORES[model].llamar_lote_async(prompt_final, len(problemas), timeout),
+            timeout=timeout,
+        )
+    except Exception as e:
+        logger.warning("Falló el análisis por lotes de %d problemas con %s: %s", len(problemas), model, e)
+        return None
+
+    datos = _extraer_json_de_respuesta(texto) if isinstance(texto, str) else None
+    resultados = datos.get("resultados") if isinstance(datos, dict) else None
+    if (not isinstance(resultados, list) or len(resultados) != len(problemas)
+            or any(_VALIDAR_RESPUESTA(r) for r in resultados)):
+        logger.warning("La respuesta por lotes de %s no tiene %d análisis válidos", model, len(problemas))
+        return None
+
+    return resultados
+
+
+# Máximo de peticiones simultáneas de un mismo análisis por lotes. El limitador de
+# tasa ya espacia las llamadas; esto evita además abrir cientos de tareas y conexiones
+# a la vez cuando la lista de problemas es grande
+CONCURRENCIA_BATCH = 16
+
+
+async def _con_semaforo(semaforo: asyncio.Semaphore, corrutina):
+    """Espera la corrutina ocupando un hueco del semáforo."""
+    async with semaforo:
+        return await corrutina
+
+
+async def analizar_viabilidad_batch(model: str, problemas: list[str]) -> list[dict]:
+    """
+    Analiza varios problemas con el mismo modelo.
+
+    Los problemas que ya están en caché se devuelven directamente. El resto se
+    agrupa en peticiones de hasta TAMANO_LOTE_PROMPT problemas, de modo que N
+    análisis cuestan unas N/5 llamadas en lugar de N; las peticiones se lanzan
+    en paralelo, con un máximo de CONCURRENCIA_BATCH a la vez. Si la respuesta
+    de un lote no se puede interpretar, sus problemas se analizan uno a uno.
+
+    Parámetros:
+        model: Nombre del modelo a usar ('gemini' o 'cerebras')
+        problemas: Lista de descripciones de problemas a analizar
+
+    Retorna:
+        Lista de diccionarios de resultado, en el mismo orden que problemas
+    """
+    resultados = [None] * len(problemas)
+    pendientes = []  # Índices de problemas distintos que requieren llamar al modelo en lote
+    vistos = set()
+
+    proveedor = _PROVEEDORES.get(model)
+    configurado = proveedor is not None and proveedor.configurado()
+    semaforo = asyncio.Semaphore(CONCURRENCIA_BATCH)
+    for i, problema in enumerate(problemas):
+        clave = _clave_cache(model, problema)
+        cacheado = _leer_cache(clave)
+        if cacheado is not None:
+            resultados[i] = cacheado
+        elif configurado and clave not in vistos and disenar_prompt_robusto(problema) is not None:
+            vistos.add(clave)
+            pendientes.append(i)
+        # Los duplicados, los problemas inválidos y los de un proveedor sin configurar
+        # quedan a None y pasan por la ruta individual (que deduplica y devuelve los errores)
+
+    lotes = [pendientes[i:i + TAMANO_LOTE_PROMPT] for i in range(0, len(pendientes), TAMANO_LOTE_PROMPT)]
+    # Un lote de un solo problema no gana nada frente a la ruta individual
+    lotes = [lote for lote in lotes if len(lote) > 1]
+    respuestas = await asyncio.gather(*[
+        _con_semaforo(semaforo, _analizar_lote_async(model, [problemas[i] for i in lote])) for lote in lotes
+    ])
+    for lote, respuesta in zip(lotes, respuestas):
+        if respuesta is None:
+            continue
+        for i, resultado_dict in zip(lote, respuesta):
+            _guardar_cache(_clave_cache(model, problemas[i]), resultado_dict)
+            resultados[i] = resultado_dict
+
+    # Ruta individual para todo lo que no se resolvió por lotes; los duplicados de un
+    # problema ya resuelto salen de la caché sin volver a llamar al modelo
+    faltantes = [i for i, resultado_dict in enumerate(resultados) if resultado_dict is None]
+    individuales = await asyncio.gather(*[
+        _con_semaforo(semaforo, analizar_viabilidad_async(model, problemas[i])) for i in faltantes
+    ])
+    for i, resultado_dict in zip(faltantes, individuales):
+        resultados[i] = resultado_dict
+
+    return resultados
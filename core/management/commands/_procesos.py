@@ -0,0 +1,23 @@
+"""
+Inicialización de los procesos worker de reclasificar_busquedas.
+
+Vive en un módulo aparte porque el proceso hijo lo importa antes de que Django
+esté configurado: no puede importar modelos (ni core.utils, que los importa).
+El prefijo "_" evita que Django lo registre como comando.
+"""
+
+import django
+from django.db import connections
+
+
+def inicializar_worker():
+    """
+    Prepara un proceso worker para clasificar consultas.
+
+    Con el método spawn el hijo arranca un intérprete limpio, así que hay que
+    cargar las apps antes de deserializar clasificar_consulta. Las conexiones se
+    cierran por si el proceso hubiera heredado alguna del padre: el worker no
+    usa la base de datos.
+    """
+    django.setup()
+    connections.close_all()
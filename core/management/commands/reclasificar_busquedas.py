@@ -1,11 +1,25 @@
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.db import connection, transaction
 from core.models import Busqueda
 from core.utils import clasificar_consulta
+from ._procesos import inicializar_worker
 
 logger = logging.getLogger(__name__)
 
+# Número de búsquedas que se leen de la base de datos (y se reparten entre procesos) por bloque
+TAMANO_LOTE = 2000
+
+# Cambios que se escriben en la base de datos de una vez
+CAMBIOS_POR_ESCRITURA = 5000
+
+# Filas por sentencia UPDATE ... FROM (VALUES ...): dos parámetros por fila, por debajo
+# del límite de 999 variables de las versiones antiguas de SQLite
+FILAS_POR_UPDATE = 400
+
 class Command(BaseCommand):
     help = 'Reclasifica todas las búsquedas existentes usando la función clasificar_consulta()'
 
@@ -20,37 +34,129 @@ class Command(BaseCommand):
             action='store_true',
             help='Aplica los cambios sin pedir confirmación',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Número de procesos para clasificar en paralelo (por defecto 1, sin paralelismo)',
+        )
+
+    def _clasificar(self, filas, workers):
+        """
+        Genera pares (fila, nueva_categoria) para cada fila (id, texto, categoría, usuario).
+
+        Las filas se procesan por bloques y cada texto distinto del bloque se
+        clasifica una sola vez: los problemas repetidos (el mismo usuario
+        reintentando, consultas de ejemplo) no se vuelven a evaluar.
+
+        clasificar_consulta es puro cálculo sobre texto, así que con varios hilos
+        el GIL no permitiría ganar nada: con --workers > 1 se reparten los textos
+        de cada bloque entre procesos. Con un solo worker se clasifica en línea.
+
+        Los procesos se crean siempre con spawn, en todas las plataformas: con
+        fork heredarían el cursor abierto por iterator() y la conexión del padre.
+        """
+        ejecutor = None
+        if workers > 1:
+            ejecutor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=inicializar_worker,
+            )
+        try:
+            while True:
+                lote = list(islice(filas, TAMANO_LOTE))
+                if not lote:
+                    break
+                textos = list(dict.fromkeys(fila[1] for fila in lote))
+                if ejecutor is None:
+                    categorias = map(clasificar_consulta, textos)
+                else:
+                    categorias = ejecutor.map(clasificar_consulta, textos, chunksize=max(1, len(textos) // workers))
+                categoria_por_texto = dict(zip(textos, categorias))
+                for fila in lote:
+                    yield fila, categoria_por_texto[fila[1]]
+        finally:
+            if ejecutor is not None:
+                ejecutor.shutdown()
+
+    def _actualizar_categorias(self, cambios):
+        """
+        Escribe las nuevas categorías y retorna cuántas filas se actualizaron.
+
+        cambios es una lista de tuplas (id, categoria_actual, nueva_categoria).
+
+        En PostgreSQL y SQLite (3.33+) cada bloque de cambios se aplica con una única
+        sentencia UPDATE ... FROM (VALUES ...), que el motor resuelve como un JOIN,
+        en lugar del CASE WHEN por fila que genera bulk_update. En otros motores
+        se usa bulk_update.
+        """
+        soporta_update_from = (
+            connection.vendor == 'postgresql'
+            or (connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 33))
+        )
+        if not soporta_update_from:
+            a_actualizar = [Busqueda(id=busqueda_id, categoria=nueva) for busqueda_id, _, nueva in cambios]
+            return Busqueda.objects.bulk_update(a_actualizar, ['categoria'], batch_size=1000)
+
+        tabla = connection.ops.quote_name(Busqueda._meta.db_table)
+        # SQLite no admite nombrar las columnas de VALUES: se llaman column1, column2...
+        if connection.vendor == 'sqlite':
+            alias, col_id, col_categoria = 'v', 'column1', 'column2'
+        else:
+            alias, col_id, col_categoria = 'v(id, categoria)', 'id', 'categoria'
+        actualizadas = 0
+        with connection.cursor() as cursor:
+            for inicio in range(0, len(cambios), FILAS_POR_UPDATE):
+                bloque = cambios[inicio:inicio + FILAS_POR_UPDATE]
+                valores = ', '.join(['(%s, %s)'] * len(bloque))
+                parametros = []
+                for busqueda_id, _, nueva_categoria in bloque:
+                    parametros.extend((busqueda_id, nueva_categoria))
+                cursor.execute(
+                    f'UPDATE {tabla} SET categoria = v.{col_categoria} '
+                    f'FROM (VALUES {valores}) AS {alias} WHERE {tabla}.id = v.{col_id}',
+                    parametros,
+                )
+                actualizadas += cursor.rowcount
+        return actualizadas
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         force = options['force']
+        workers = options['workers']
 
         if dry_run:
             self.stdout.write(
                 self.style.WARNING('Ejecutando en modo DRY-RUN. No se aplicarán cambios.')
             )
 
-        # Obtener todas las búsquedas existentes
-        busquedas = Busqueda.objects.all()
+        # Obtener todas las búsquedas existentes como tuplas con solo las columnas necesarias:
+        # el nombre de usuario llega en la misma consulta (JOIN) y la fase de comparación
+        # no necesita construir instancias del modelo
+        busquedas = Busqueda.objects.values_list('id', 'texto_problema', 'categoria', 'usuario__username')
         total_busquedas = busquedas.count()
 
         self.stdout.write(f'Encontradas {total_busquedas} búsquedas para reclasificar.')
 
         cambios_aplicados = 0
+        # De cada cambio se retiene (id, categoría actual, nueva categoría) y la
+        # línea de detalle ya formateada, con el texto recortado a 100 caracteres
         cambios_pendientes = []
+        detalles = []
 
-        for busqueda in busquedas:
-            nueva_categoria = clasificar_consulta(busqueda.texto_problema)
-            categoria_actual = busqueda.categoria
+        # iterator() recorre la tabla por bloques en lugar de materializarla entera en memoria
+        for fila, nueva_categoria in self._clasificar(busquedas.iterator(chunk_size=TAMANO_LOTE), workers):
+            busqueda_id, texto_problema, categoria_actual, username = fila
 
             if nueva_categoria != categoria_actual:
-                cambios_pendientes.append({
-                    'id': busqueda.id,
-                    'usuario': busqueda.usuario.username,
-                    'texto_original': busqueda.texto_problema[:100] + '...' if len(busqueda.texto_problema) > 100 else busqueda.texto_problema,
-                    'categoria_actual': categoria_actual,
-                    'nueva_categoria': nueva_categoria,
-                })
+                texto_original = texto_problema[:100] + '...' if len(texto_problema) > 100 else texto_problema
+                detalles.append(
+                    f'ID: {busqueda_id} | Usuario: {username} | '
+                    f'Actual: {categoria_actual} -> Nueva: {nueva_categoria}\n'
+                    f'Texto: {texto_original}\n'
+                )
+                cambios_pendientes.append((busqueda_id, categoria_actual, nueva_categoria))
 
         if not cambios_pendientes:
             self.stdout.write(
@@ -61,12 +167,8 @@ class Command(BaseCommand):
         self.stdout.write(f'Se encontraron {len(cambios_pendientes)} búsquedas con categorías desactualizadas.')
 
         # Mostrar cambios pendientes
-        for cambio in cambios_pendientes:
-            self.stdout.write(
-                f'ID: {cambio["id"]} | Usuario: {cambio["usuario"]} | '
-                f'Actual: {cambio["categoria_actual"]} -> Nueva: {cambio["nueva_categoria"]}\n'
-                f'Texto: {cambio["texto_original"]}\n'
-            )
+        for detalle in detalles:
+            self.stdout.write(detalle)
 
         if dry_run:
             self.stdout.write(
@@ -83,25 +185,23 @@ class Command(BaseCommand):
                 self.stdout.write('Operación cancelada.')
                 return
 
-        # Aplicar cambios en una transacción
-        with transaction.atomic():
-            for cambio in cambios_pendientes:
-                try:
-                    busqueda = Busqueda.objects.get(id=cambio['id'])
-                    busqueda.categoria = cambio['nueva_categoria']
-                    busqueda.save()
-
-                    logger.info(
-                        f'Búsqueda ID {busqueda.id} reclasificada: '
-                        f'{cambio["categoria_actual"]} -> {cambio["nueva_categoria"]}'
+        # Aplicar cambios en una transacción, escribiendo por bloques
+        # en lugar de un SELECT + UPDATE por cada búsqueda
+        try:
+            with transaction.atomic():
+                for inicio in range(0, len(cambios_pendientes), CAMBIOS_POR_ESCRITURA):
+                    cambios_aplicados += self._actualizar_categorias(
+                        cambios_pendientes[inicio:inicio + CAMBIOS_POR_ESCRITURA]
                     )
-                    cambios_aplicados += 1
+        except Exception as e:
+            logger.error(f'Error al reclasificar búsquedas: {str(e)}')
+            self.stdout.write(
+                self.style.ERROR(f'Error al aplicar la reclasificación: {str(e)}')
+            )
+            return
 
-                except Exception as e:
-                    logger.error(f'Error al reclasificar búsqueda ID {cambio["id"]}: {str(e)}')
-                    self.stdout.write(
-                        self.style.ERROR(f'Error al procesar búsqueda ID {cambio["id"]}: {str(e)}')
-                    )
+        for busqueda_id, categoria_actual, nueva_categoria in cambios_pendientes:
+            logger.info(f'Búsqueda ID {busqueda_id} reclasificada: {categoria_actual} -> {nueva_categoria}')
 
         self.stdout.write(
             self.style.SUCCESS(f'Reclasificación completada. {cambios_aplicados} búsquedas actualizadas.')
@@ -3,38 +3,43 @@ from django.test import TestCase
 from django.core.management import call_command
 from django.contrib.auth.models import User
 from io import StringIO
-from core.models import Busqueda
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import patch
+from core.models import Busqueda, CATEGORIAS_VALIDAS
+from core.utils import clasificar_consulta
 
 
 class ReclasificarBusquedasCommandTest(TestCase):
     """Test suite for reclasificar_busquedas management command"""
 
-    def setUp(self):
-        """Set up test data"""
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data once for the whole class"""
+        cls.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
             password='testpass123'
         )
 
         # Create test busquedas with old categories that need reclasification
-        self.busqueda1 = Busqueda.objects.create(
-            usuario=self.user,
-            texto_problema='Automatizar proceso de facturación',
-            categoria='Emprendimiento'  # Old category
-        )
-
-        self.busqueda2 = Busqueda.objects.create(
-            usuario=self.user,
-            texto_problema='Sistema de predicción de ventas',
-            categoria='Negocio'  # Old category
-        )
-
-        self.busqueda3 = Busqueda.objects.create(
-            usuario=self.user,
-            texto_problema='Chatbot para atención al cliente',
-            categoria='Automatización'  # Already correct
-        )
+        # (one multi-row INSERT instead of one per busqueda)
+        cls.busqueda1, cls.busqueda2, cls.busqueda3 = Busqueda.objects.bulk_create([
+            Busqueda(
+                usuario=cls.user,
+                texto_problema='Automatizar proceso de facturación',
+                categoria='Emprendimiento'  # Old category
+            ),
+            Busqueda(
+                usuario=cls.user,
+                texto_problema='Sistema de predicción de ventas',
+                categoria='Negocio'  # Old category
+            ),
+            Busqueda(
+                usuario=cls.user,
+                texto_problema='Chatbot para atención al cliente',
+                categoria='Automatización'  # Already correct
+            ),
+        ])
 
     def test_command_output(self):
         """Test that command produces expected output"""
@@ -144,17 +149,7 @@ class ReclasificarBusquedasCommandTest(TestCase):
 
         # All busquedas should have valid categories after command
         for busqueda in Busqueda.objects.all():
-            self.assertIn(busqueda.categoria, [
-                'Automatización',
-                'Análisis de datos / predicción',
-                'Procesamiento de texto',
-                'Procesamiento de imágenes / video',
-                'Procesamiento de audio / voz',
-                'Generación de contenido',
-                'Recomendación / personalización',
-                'Optimización / decisión inteligente',
-                'Asistentes conversacionales'
-            ])
+            self.assertIn(busqueda.categoria, CATEGORIAS_VALIDAS)
 
     def test_command_updates_correct_count(self):
         """Test that command reports correct number of busquedas processed"""
@@ -165,4 +160,100 @@ class ReclasificarBusquedasCommandTest(TestCase):
 
         output = out.getvalue()
         # Should mention the same count as we have
-        self.assertIn(str(initial_count), output)
\ No newline at end of file
+        self.assertIn(str(initial_count), output)
+
+
+class ReclasificarBusquedasOptionsTest(TestCase):
+    """Test suite for the reclasificar_busquedas options and bulk update path"""
+
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data once for the whole class"""
+        cls.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123'
+        )
+        cls.desactualizada, cls.correcta = Busqueda.objects.bulk_create([
+            # Categoría desactualizada: el texto habla de un chatbot
+            Busqueda(
+                usuario=cls.user,
+                texto_problema='Crear un chatbot para soporte al cliente',
+                categoria='Automatización'
+            ),
+            # Categoría ya correcta
+            Busqueda(
+                usuario=cls.user,
+                texto_problema='Automatizar tareas repetitivas de oficina',
+                categoria='Automatización'
+            ),
+        ])
+
+    def test_force_applies_changes(self):
+        """Test that --force updates only the outdated categories"""
+        out = StringIO()
+        call_command('reclasificar_busquedas', '--force', stdout=out)
+
+        self.desactualizada.refresh_from_db()
+        self.correcta.refresh_from_db()
+        self.assertEqual(self.desactualizada.categoria, 'Asistentes conversacionales')
+        self.assertEqual(self.correcta.categoria, 'Automatización')
+        self.assertIn('1 búsquedas actualizadas', out.getvalue())
+
+    def test_dry_run_does_not_apply_changes(self):
+        """Test that --dry-run only reports the pending changes"""
+        out = StringIO()
+        call_command('reclasificar_busquedas', '--dry-run', stdout=out)
+
+        self.desactualizada.refresh_from_db()
+        self.assertEqual(self.desactualizada.categoria, 'Automatización')
+        self.assertIn('1 cambios pendientes', out.getvalue())
+
+    def test_dry_run_lists_changes_after_summary(self):
+        """Test that the pending changes are listed after the summary line"""
+        out = StringIO()
+        call_command('reclasificar_busquedas', '--dry-run', stdout=out)
+
+        salida = out.getvalue()
+        resumen = salida.index('búsquedas con categorías desactualizadas')
+        self.assertLess(resumen, salida.index(f'ID: {self.desactualizada.id} |'))
+
+    def test_workers_matches_serial_result(self):
+        """Test that classifying with several spawned processes gives the same result"""
+        out = StringIO()
+        with patch('core.management.commands.reclasificar_busquedas.ProcessPoolExecutor',
+                   wraps=ProcessPoolExecutor) as pool:
+            call_command('reclasificar_busquedas', '--force', '--workers', '2', stdout=out)
+
+        pool.assert_called_once()
+        self.assertEqual(pool.call_args.kwargs['mp_context'].get_start_method(), 'spawn')
+
+        self.desactualizada.refresh_from_db()
+        self.correcta.refresh_from_db()
+        self.assertEqual(self.desactualizada.categoria, 'Asistentes conversacionales')
+        self.assertEqual(self.correcta.categoria, 'Automatización')
+
+    def test_force_updates_more_rows_than_one_statement(self):
+        """Test that changes spanning several UPDATE blocks are all applied"""
+        Busqueda.objects.bulk_create([
+            Busqueda(usuario=self.user, texto_problema=f'Chatbot número {i}', categoria='Automatización')
+            for i in range(450)
+        ])
+        out = StringIO()
+        call_command('reclasificar_busquedas', '--force', stdout=out)
+
+        self.assertEqual(Busqueda.objects.filter(categoria='Asistentes conversacionales').count(), 451)
+        self.assertIn('451 búsquedas actualizadas', out.getvalue())
+
+    def test_repeated_texts_are_classified_once(self):
+        """Test that identical problem texts are classified only once"""
+        Busqueda.objects.bulk_create([
+            Busqueda(usuario=self.user, texto_problema='Crear un chatbot para soporte al cliente', categoria='Automatización')
+            for _ in range(5)
+        ])
+        with patch('core.management.commands.reclasificar_busquedas.clasificar_consulta',
+                   wraps=clasificar_consulta) as mock_clasificar:
+            call_command('reclasificar_busquedas', '--force', stdout=StringIO())
+
+        self.assertEqual(mock_clasificar.call_count, 2)
+        self.assertEqual(Busqueda.objects.filter(categoria='Asistentes conversacionales').count(), 6)
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-15 01:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_alter_busqueda_categoria_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='busqueda',
+            index=models.Index(fields=['usuario', '-fecha_creacion'], name='busq_user_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='busqueda',
+            index=models.Index(fields=['categoria'], name='busq_cat'),
+        ),
+    ]
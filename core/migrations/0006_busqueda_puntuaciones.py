@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-15 02:21
+
+import json
+
+from django.db import migrations, models
+
+# Copia congelada de core.models.INDICES_CLAVE y extraer_puntuaciones tal como
+# estaban al escribir esta migración: los cambios posteriores del modelo no
+# deben alterar lo que hace al volver a aplicarse
+INDICES_CLAVE = ('adecuacion_ia', 'factibilidad_tecnica', 'impacto_potencial')
+
+
+def extraer_puntuaciones(resultado_llm):
+    """Tupla (adecuación, factibilidad, impacto) del análisis, o None si no tiene indices_clave."""
+    if isinstance(resultado_llm, str):
+        try:
+            resultado_llm = json.loads(resultado_llm)
+        except ValueError:
+            return None
+    if not isinstance(resultado_llm, dict) or not isinstance(resultado_llm.get('indices_clave'), dict):
+        return None
+    indices_clave = resultado_llm['indices_clave']
+    try:
+        return tuple(round(indices_clave.get(indice, {}).get('puntuacion', 0)) for indice in INDICES_CLAVE)
+    except (AttributeError, TypeError):
+        return None
+
+
+def rellenar_puntuaciones(apps, schema_editor):
+    """Copia las puntuaciones de los análisis ya guardados a las nuevas columnas."""
+    Busqueda = apps.get_model('core', 'Busqueda')
+    pendientes = []
+    for busqueda in Busqueda.objects.exclude(resultado_llm__isnull=True).only('id', 'resultado_llm').iterator(chunk_size=2000):
+        puntuaciones = extraer_puntuaciones(busqueda.resultado_llm)
+        if puntuaciones is None:
+            continue
+        busqueda.puntuacion_adecuacion, busqueda.puntuacion_factibilidad, busqueda.puntuacion_impacto = puntuaciones
+        pendientes.append(busqueda)
+        if len(pendientes) >= 1000:
+            Busqueda.objects.bulk_update(pendientes, ['puntuacion_adecuacion', 'puntuacion_factibilidad', 'puntuacion_impacto'])
+            pendientes = []
+    if pendientes:
+        Busqueda.objects.bulk_update(pendientes, ['puntuacion_adecuacion', 'puntuacion_factibilidad', 'puntuacion_impacto'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_busqueda_indices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='busqueda',
+            name='puntuacion_adecuacion',
+            field=models.SmallIntegerField(blank=True, editable=False, help_text='Puntuación de adecuación de IA del análisis', null=True),
+        ),
+        migrations.AddField(
+            model_name='busqueda',
+            name='puntuacion_factibilidad',
+            field=models.SmallIntegerField(blank=True, editable=False, help_text='Puntuación de factibilidad técnica del análisis', null=True),
+        ),
+        migrations.AddField(
+            model_name='busqueda',
+            name='puntuacion_impacto',
+            field=models.SmallIntegerField(blank=True, editable=False, help_text='Puntuación de impacto potencial del análisis', null=True),
+        ),
+        migrations.RunPython(rellenar_puntuaciones, migrations.RunPython.noop),
+    ]
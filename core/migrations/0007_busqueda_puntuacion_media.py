@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-15 02:24
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Round
+
+
+def rellenar_puntuacion_media(apps, schema_editor):
+    """Calcula el promedio de las búsquedas ya puntuadas con un único UPDATE."""
+    Busqueda = apps.get_model('core', 'Busqueda')
+    # La media de tres enteros nunca acaba en .5, así que ROUND coincide con round()
+    Busqueda.objects.filter(puntuacion_adecuacion__isnull=False).update(
+        puntuacion_media=Round(
+            (F('puntuacion_adecuacion') + F('puntuacion_factibilidad') + F('puntuacion_impacto')) / 3.0
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_busqueda_puntuaciones'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='busqueda',
+            name='puntuacion_media',
+            field=models.SmallIntegerField(blank=True, editable=False, help_text='Promedio de viabilidad de las tres puntuaciones del análisis', null=True),
+        ),
+        migrations.RunPython(rellenar_puntuacion_media, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-15 02:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_busqueda_puntuacion_media'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='busqueda',
+            index=models.Index(fields=['fecha_creacion'], name='busq_fecha'),
+        ),
+    ]
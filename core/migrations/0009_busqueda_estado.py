@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-15 03:10
+
+from django.db import migrations, models
+
+
+def marcar_sin_resultado(apps, schema_editor):
+    """Las búsquedas guardadas sin resultado (análisis en segundo plano interrumpidos) quedan con error."""
+    Busqueda = apps.get_model('core', 'Busqueda')
+    Busqueda.objects.filter(resultado_llm__isnull=True).update(estado='error')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_busqueda_indice_fecha'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='busqueda',
+            name='estado',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('completada', 'Completada'), ('error', 'Error')], default='completada', help_text='Estado del análisis de la búsqueda', max_length=10),
+        ),
+        migrations.RunPython(marcar_sin_resultado, migrations.RunPython.noop),
+    ]
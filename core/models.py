@@ -7,10 +7,71 @@ de viabilidad de IA realizadas por los usuarios, incluyendo resultados, categor
 y metadatos asociados.
 """
 
+import orjson  # Para leer el análisis, que las vistas guardan serializado como texto JSON
 from django.db import models  # Para definir modelos de base de datos Django
 from django.contrib.auth.models import User  # Modelo de usuario estándar de Django
 
 
+# Categorías de IA reconocidas por el sistema, en el orden en que se muestran.
+# El nombre se guarda tal cual en la columna categoria.
+CATEGORIAS = [
+    'Automatización',
+    'Análisis de datos / predicción',
+    'Procesamiento de texto',
+    'Procesamiento de imágenes / video',
+    'Procesamiento de audio / voz',
+    'Generación de contenido',
+    'Recomendación / personalización',
+    'Optimización / decisión inteligente',
+    'Asistentes conversacionales',
+]
+
+# Mismas categorías como conjunto, para comprobar pertenencia sin recorrer la lista
+CATEGORIAS_VALIDAS = frozenset(CATEGORIAS)
+
+
+# Índices clave del análisis cuya puntuación se guarda también en columnas propias
+INDICES_CLAVE = ('adecuacion_ia', 'factibilidad_tecnica', 'impacto_potencial')
+
+
+def extraer_puntuaciones(resultado_llm):
+    """
+    Extrae las puntuaciones de los tres índices clave de un análisis.
+
+    Parámetros:
+        resultado_llm: Análisis como dict o serializado como texto JSON
+
+    Retorna:
+        Tupla (adecuación, factibilidad, impacto), con 0 para los índices que
+        falten, o None si el análisis no tiene indices_clave
+    """
+    if isinstance(resultado_llm, str):
+        try:
+            resultado_llm = orjson.loads(resultado_llm)
+        except orjson.JSONDecodeError:
+            return None
+    if not isinstance(resultado_llm, dict) or not isinstance(resultado_llm.get('indices_clave'), dict):
+        return None
+    indices_clave = resultado_llm['indices_clave']
+    try:
+        return tuple(round(indices_clave.get(indice, {}).get('puntuacion', 0)) for indice in INDICES_CLAVE)
+    except (AttributeError, TypeError):
+        return None
+
+
+class BusquedaManager(models.Manager):
+    """
+    Manager por defecto de Busqueda.
+
+    Trae el usuario en la misma consulta (JOIN) porque casi todos los listados
+    y el __str__ acceden a usuario.username; sin esto cada fila dispara un
+    SELECT adicional a auth_user.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('usuario')
+
+
 class Busqueda(models.Model):
     """
     Modelo principal que representa una consulta de viabilidad de IA realizada por un usuario.
@@ -47,30 +108,79 @@ class Busqueda(models.Model):
         help_text="Respuesta completa del LLM en formato JSON"
     )
 
+    # Estado del análisis. Las búsquedas con ANALISIS_EN_SEGUNDO_PLANO se crean
+    # pendientes y el hilo que las analiza las marca como completadas o con error
+    estado = models.CharField(
+        max_length=10,
+        choices=[('pendiente', 'Pendiente'), ('completada', 'Completada'), ('error', 'Error')],
+        default='completada',  # El análisis síncrono guarda la búsqueda ya con su resultado
+        help_text="Estado del análisis de la búsqueda"
+    )
+
     # Clasificación automática del tipo de problema/IA basado en el contenido
     categoria = models.CharField(
         max_length=50,
-        choices=[
-            ('Automatización', 'Automatización'),
-            ('Análisis de datos / predicción', 'Análisis de datos / predicción'),
-            ('Procesamiento de texto', 'Procesamiento de texto'),
-            ('Procesamiento de imágenes / video', 'Procesamiento de imágenes / video'),
-            ('Procesamiento de audio / voz', 'Procesamiento de audio / voz'),
-            ('Generación de contenido', 'Generación de contenido'),
-            ('Recomendación / personalización', 'Recomendación / personalización'),
-            ('Optimización / decisión inteligente', 'Optimización / decisión inteligente'),
-            ('Asistentes conversacionales', 'Asistentes conversacionales')
-        ],
+        choices=[(categoria, categoria) for categoria in CATEGORIAS],
         default='Automatización',  # Categoría por defecto
         help_text="Categoría de la consulta"
     )
 
+    # Puntuaciones de los índices clave copiadas de resultado_llm al guardar, para
+    # que el panel de estadísticas las agregue en la base de datos sin leer el JSON
+    puntuacion_adecuacion = models.SmallIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Puntuación de adecuación de IA del análisis"
+    )
+    puntuacion_factibilidad = models.SmallIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Puntuación de factibilidad técnica del análisis"
+    )
+    puntuacion_impacto = models.SmallIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Puntuación de impacto potencial del análisis"
+    )
+
+    # Promedio redondeado de las tres puntuaciones (la "viabilidad" que muestran el
+    # resultado y el panel), calculado una sola vez al guardar
+    puntuacion_media = models.SmallIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Promedio de viabilidad de las tres puntuaciones del análisis"
+    )
+
     # Timestamp automático de cuando se creó la búsqueda
     fecha_creacion = models.DateTimeField(
         auto_now_add=True,  # Se establece automáticamente al crear el registro
         help_text="Fecha y hora en que se realizó la búsqueda"
     )
 
+    # Manager con select_related('usuario'). Las cascadas y accesos a relaciones
+    # siguen usando el _base_manager (un models.Manager simple) de Django
+    objects = BusquedaManager()
+
+    def save(self, *args, **kwargs):
+        """
+        Guarda la búsqueda sincronizando las columnas de puntuación con resultado_llm.
+
+        bulk_create y las actualizaciones masivas no pasan por aquí; quien
+        escriba resultado_llm por esas vías debe rellenar también las puntuaciones.
+        """
+        puntuaciones = extraer_puntuaciones(self.resultado_llm)
+        if puntuaciones is None:
+            self.puntuacion_adecuacion = self.puntuacion_factibilidad = self.puntuacion_impacto = None
+            self.puntuacion_media = None
+        else:
+            self.puntuacion_adecuacion, self.puntuacion_factibilidad, self.puntuacion_impacto = puntuaciones
+            self.puntuacion_media = round(sum(puntuaciones) / 3)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         """
         Representación legible del objeto para uso en admin y debugging.
@@ -89,5 +199,13 @@ class Busqueda(models.Model):
         de administración y otras configuraciones del modelo.
         """
         ordering = ['-fecha_creacion']  # Las búsquedas más recientes primero
+        indexes = [
+            # Historial de cada usuario, ya ordenado de más reciente a más antigua
+            models.Index(fields=['usuario', '-fecha_creacion'], name='busq_user_recent'),
+            # Conteos y filtros por categoría (panel de estadísticas, reclasificación)
+            models.Index(fields=['categoria'], name='busq_cat'),
+            # Rangos de fechas del panel (últimos 7/30 días) y el listado general por fecha
+            models.Index(fields=['fecha_creacion'], name='busq_fecha'),
+        ]
         verbose_name = "Búsqueda"  # Nombre singular en español
         verbose_name_plural = "Búsquedas"  # Nombre plural en español
@@ -1,11 +1,23 @@
 import pytest
 import json
+import os
+import asyncio
+import threading
+import time
 from django.test import TestCase
-from unittest.mock import patch, MagicMock, mock_open
+from django.core.cache import caches
+from unittest.mock import patch, MagicMock, AsyncMock, mock_open
+from tenacity import wait_none
+from google.api_core import exceptions as google_exceptions
+from core import llm_service
 from core.llm_service import (
     analizar_viabilidad_con_gemini,
+    analizar_viabilidad_con_gemini_async,
     analizar_viabilidad_con_cerebras,
     analizar_viabilidad,
+    analizar_viabilidad_async,
+    analizar_viabilidad_batch,
+    analizar_viabilidad_stream,
     disenar_prompt_robusto
 )
 
@@ -16,6 +28,22 @@ class LLMServiceTest(TestCase):
     def setUp(self):
         """Set up test data"""
         self.test_problema = "Implementar un sistema de IA para automatizar el procesamiento de facturas"
+        # Los análisis se cachean; cada test parte de una caché vacía
+        caches[llm_service.LLM_CACHE_ALIAS].clear()
+        # El modelo de Gemini se comparte entre llamadas; cada test crea el suyo
+        llm_service._obtener_modelo_gemini.cache_clear()
+        # Sin límite de tasa para que los tests no esperen a que se repongan tokens
+        limitadores = patch.multiple(
+            llm_service,
+            _LIMITADOR_CEREBRAS=llm_service._LimitadorTasa(0),
+            _LIMITADOR_GEMINI=llm_service._LimitadorTasa(0),
+        )
+        limitadores.start()
+        self.addCleanup(limitadores.stop)
+        # Clave ficticia: los tests de Gemini no dependen del entorno de quien los ejecuta
+        clave_gemini = patch.dict(os.environ, {'GEMINI_API_KEY': 'test-key'})
+        clave_gemini.start()
+        self.addCleanup(clave_gemini.stop)
 
     @patch('core.llm_service.genai.GenerativeModel')
     def test_analizar_viabilidad_con_gemini_success(self, mock_model_class):
@@ -90,6 +118,23 @@ class LLMServiceTest(TestCase):
         self.assertIn("error", result)
         self.assertIn("La respuesta del modelo no es un JSON válido", result["error"])
 
+    @patch('core.llm_service.genai.GenerativeModel')
+    def test_analizar_viabilidad_con_gemini_wrong_field_type(self, mock_model_class):
+        """Test that a response with a mistyped field is rejected and not cached"""
+        mock_model = MagicMock()
+        mock_response = MagicMock()
+        mock_response.text = '{"titulo_proyecto": "Test", "indices_clave": [85, 70, 60]}'
+        mock_model.generate_content.return_value = mock_response
+        mock_model_class.return_value = mock_model
+
+        result = analizar_viabilidad_con_gemini(self.test_problema)
+        self.assertIn("respuesta.indices_clave", result["error"])
+
+        mock_response.text = '["no", "es", "un", "objeto"]'
+        result = analizar_viabilidad_con_gemini(self.test_problema)
+        self.assertIn("no tiene la estructura esperada", result["error"])
+        self.assertEqual(mock_model.generate_content.call_count, 2)
+
     def test_disenar_prompt_robusto(self):
         """Test disenar_prompt_robusto function"""
         prompt = disenar_prompt_robusto(self.test_problema)
@@ -118,7 +163,6 @@ class LLMServiceTest(TestCase):
 
     def test_analizar_viabilidad_gemini_missing_api_key(self):
         """Test analizar_viabilidad_con_gemini with missing API key"""
-        import os
         original_key = os.environ.get("GEMINI_API_KEY")
         try:
             os.environ.pop("GEMINI_API_KEY", None)
@@ -131,7 +175,6 @@ class LLMServiceTest(TestCase):
 
     def test_analizar_viabilidad_cerebras_missing_api_key(self):
         """Test analizar_viabilidad_con_cerebras with missing API key"""
-        import os
         original_key = os.environ.get("CEREBRAS_API_KEY")
         try:
             os.environ.pop("CEREBRAS_API_KEY", None)
@@ -190,6 +233,196 @@ class LLMServiceTest(TestCase):
         self.assertIn("error", result)
         self.assertIn("La respuesta del modelo no es un JSON válido", result["error"])
 
+    @patch('core.llm_service.genai.GenerativeModel')
+    def test_analizar_viabilidad_con_gemini_uses_cache(self, mock_model_class):
+        """Test that a repeated problem is served from cache without calling the API"""
+        mock_model = MagicMock()
+        mock_response = MagicMock()
+        mock_response.text = '{"titulo_proyecto": "Cached"}'
+        mock_model.generate_content.return_value = mock_response
+        mock_model_class.return_value = mock_model
+
+        first = analizar_viabilidad_con_gemini(self.test_problema)
+        second = analizar_viabilidad_con_gemini("  " + self.test_problema + "  ")
+
+        self.assertEqual(first, second)
+        self.assertEqual(mock_model.generate_content.call_count, 1)
+
+    @patch('core.llm_service.genai.GenerativeModel')
+    def test_analizar_viabilidad_con_gemini_cache_ignores_case_and_spacing(self, mock_model_class):
+        """Test that problems differing only in case or whitespace share a cache entry"""
+        mock_model = MagicMock()
+        mock_response = MagicMock()
+        mock_response.text = '{"titulo_proyecto": "Cached"}'
+        mock_model.generate_content.return_value = mock_response
+        mock_model_class.return_value = mock_model
+
+        first = analizar_viabilidad_con_gemini("Quiero  automatizar\nel inventario")
+        second = analizar_viabilidad_con_gemini("quiero automatizar el INVENTARIO")
+
+        self.assertEqual(first, second)
+        self.assertEqual(mock_model.generate_content.call_count, 1)
+
+    @patch('core.llm_service.genai.GenerativeModel')
+    def test_analizar_viabilidad_con_gemini_does_not_cache_errors(self, mock_model_class):
+        """Test that error results are not cached"""
+        mock_model = MagicMock()
+        mock_model.generate_content.side_effect = Exception("API Error")
+        mock_model_class.return_value = mock_model
+
+        analizar_viabilidad_con_gemini(self.test_problema)
+        analizar_viabilidad_con_gemini(self.test_problema)
+
+        self.assertEqual(mock_model.generate_content.call_count, 2)
+
+    @patch.object(llm_service._llamar_gemini.retry, 'wait', wait_none())
+    @patch('core.llm_service.genai.GenerativeModel')
+    def test_analizar_viabilidad_con_gemini_retries_transient_errors(self, mock_model_class):
+        """Test that a transient provider error is retried until it succeeds"""
+        mock_model = MagicMock()
+        mock_response = MagicMock()
+        mock_response.text = '{"titulo_proyecto": "Test"}'
+        mock_model.generate_content.side_effect = [
+            google_exceptions.ServiceUnavailable("Servicio no disponible"),
+            mock_response,
+        ]
+        mock_model_class.return_value = mock_model
+
+        result = analizar_viabilidad_con_gemini(self.test_problema)
+
+        self.assertEqual(result["titulo_proyecto"], "Test")
+        self.assertEqual(mock_model.generate_content.call_count, 2)
+
+    @patch.object(llm_service._llamar_gemini.retry, 'wait', wait_none())
+    @patch('core.llm_service.genai.GenerativeModel')
+    def test_analizar_viabilidad_con_gemini_gives_up_after_retries(self, mock_model_class):
+        """Test that persistent transient errors stop after three attempts"""
+        mock_model = MagicMock()
+        mock_model.generate_content.side_effect = google_exceptions.ResourceExhausted("Cuota agotada")
+        mock_model_class.return_value = mock_model
+
+        result = analizar_viabilidad_con_gemini(self.test_problema)
+
+        self.assertIn("error", result)
+        self.assertEqual(mock_model.generate_content.call_count, 3)
+
+    @patch('core.llm_service.genai.GenerativeModel')
+    def test_analizar_viabilidad_stream_gemini(self, mock_model_class):
+        """Test that fields are streamed as they complete and the full result comes last"""
+        fragmentos = ['{"titulo_proyecto": "Te', 'st", "indices_clave": {"adecuacion_ia": ', '{"puntuacion": 80}}', '}']
+        chunks = [MagicMock(text=fragmento) for fragmento in fragmentos]
+        mock_model = MagicMock()
+        mock_model.generate_content.return_value = iter(chunks)
+        mock_model_class.return_value = mock_model
+
+        eventos = list(analizar_viabilidad_stream('gemini', self.test_problema))
+
+        self.assertEqual(eventos[0], ("campo", {"clave": "titulo_proyecto", "valor": "Test"}))
+        self.assertEqual(eventos[1][1]["clave"], "indices_clave")
+        self.assertEqual(eventos[-1][0], "resultado")
+        self.assertEqual(eventos[-1][1]["indices_clave"]["adecuacion_ia"]["puntuacion"], 80)
+
+    @patch('core.llm_service.genai.GenerativeModel')
+    def test_analizar_viabilidad_stream_invalid_json(self, mock_model_class):
+        """Test that a streamed response without JSON ends with an error event"""
+        mock_model = MagicMock()
+        mock_model.generate_content.return_value = iter([MagicMock(text="Sin JSON")])
+        mock_model_class.return_value = mock_model
+
+        eventos = list(analizar_viabilidad_stream('gemini', self.test_problema))
+
+        self.assertEqual(eventos[-1][0], "error")
+        self.assertIn("no contiene un JSON válido", eventos[-1][1]["error"])
+
+    def test_analizar_viabilidad_stream_invalid_model(self):
+        """Test analizar_viabilidad_stream with invalid model"""
+        eventos = list(analizar_viabilidad_stream('invalid_model', self.test_problema))
+        self.assertEqual(len(eventos), 1)
+        self.assertIn("Modelo no soportado", eventos[0][1]["error"])
+
+    @patch('core.llm_service.genai.GenerativeModel')
+    def test_concurrent_identical_calls_share_one_request(self, mock_model_class):
+        """Test that a duplicate request arriving mid-call waits for the first one"""
+        llamada_iniciada = threading.Event()
+        liberar = threading.Event()
+        mock_response = MagicMock()
+        mock_response.text = '{"titulo_proyecto": "Test"}'
+
+        def slow_call(prompt, stream=False):
+            llamada_iniciada.set()
+            liberar.wait(5)
+            return mock_response
+
+        mock_model = MagicMock()
+        mock_model.generate_content.side_effect = slow_call
+        mock_model_class.return_value = mock_model
+
+        results = []
+        hilos = [threading.Thread(target=lambda: results.append(analizar_viabilidad_con_gemini(self.test_problema)))
+                 for _ in range(2)]
+        hilos[0].start()
+        llamada_iniciada.wait(5)
+        hilos[1].start()
+        time.sleep(0.1)
+        liberar.set()
+        for hilo in hilos:
+            hilo.join(5)
+
+        self.assertEqual([r["titulo_proyecto"] for r in results], ["Test", "Test"])
+        self.assertEqual(mock_model.generate_content.call_count, 1)
+
+    @patch('core.llm_service.CEREBRAS_API_KEY', 'test-key')
+    @patch('core.llm_service._CLIENTE_CEREBRAS')
+    def test_analizar_viabilidad_con_cerebras_json_with_surrounding_text(self, mock_client):
+        """Test that the JSON object is extracted when the model adds text around it"""
+        mock_response = MagicMock()
+        mock_response.choices[0].message.content = (
+            'Aquí tienes el análisis {no es json}:\n```json\n'
+            '{"titulo_proyecto": "Test", "indices_clave": {"adecuacion_ia": {"puntuacion": 80}}}'
+            '\n```\nEspero que sea útil.'
+        )
+        mock_client.chat.completions.create.return_value = mock_response
+
+        result = analizar_viabilidad_con_cerebras(self.test_problema)
+
+        self.assertEqual(result['titulo_proyecto'], 'Test')
+        self.assertEqual(result['indices_clave']['adecuacion_ia']['puntuacion'], 80)
+
+    @patch('core.llm_service.CEREBRAS_API_KEY', 'test-key')
+    @patch('core.llm_service._CLIENTE_CEREBRAS')
+    def test_analizar_viabilidad_con_cerebras_unexpected_structure(self, mock_client):
+        """Test that a response without choices returns an error"""
+        mock_response = MagicMock()
+        mock_response.choices = []
+        mock_client.chat.completions.create.return_value = mock_response
+
+        result = analizar_viabilidad_con_cerebras(self.test_problema)
+
+        self.assertIn("error", result)
+        self.assertIn("estructura esperada", result["error"])
+
+    @patch('core.llm_service.CEREBRAS_API_KEY', 'test-key')
+    @patch('core.llm_service._CLIENTE_CEREBRAS')
+    def test_analizar_viabilidad_con_cerebras_without_json(self, mock_client):
+        """Test that a response without a JSON object returns an error"""
+        mock_response = MagicMock()
+        mock_response.choices[0].message.content = 'No puedo analizar {esto'
+        mock_client.chat.completions.create.return_value = mock_response
+
+        result = analizar_viabilidad_con_cerebras(self.test_problema)
+
+        self.assertIn("error", result)
+        self.assertIn("no contiene un JSON válido", result["error"])
+
+    def test_response_schema_matches_prompt_structure(self):
+        """Test that the JSON schema requires every top-level field the prompt asks for"""
+        prompt = disenar_prompt_robusto(self.test_problema)
+        for field in llm_service.ESQUEMA_RESPUESTA["required"]:
+            self.assertIn(f'"{field}"', prompt)
+        self.assertEqual(
+            llm_service._parametros_cerebras(prompt)["response_format"], {"type": "json_object"}
+        )
+
     def test_disenar_prompt_robusto_includes_problem_context(self):
         """Test that the prompt includes the problem context"""
         prompt = disenar_prompt_robusto(self.test_problema)
@@ -210,4 +443,206 @@ class LLMServiceTest(TestCase):
         # Should specify array structure for consultas_relacionadas
         self.assertIn('"titulo"', prompt)
         self.assertIn('"descripcion"', prompt)
-        self.assertIn('"consulta_completa"', prompt)
\ No newline at end of file
+        self.assertIn('"consulta_completa"', prompt)
+
+    def test_disenar_prompt_robusto_reuses_built_prompt(self):
+        """Test that repeated problems reuse the cached prompt string"""
+        primero = disenar_prompt_robusto(self.test_problema)
+        segundo = disenar_prompt_robusto("  " + self.test_problema + "\n")
+
+        self.assertIs(primero, segundo)
+        self.assertIsNone(disenar_prompt_robusto(["no", "es", "texto"]))
+
+class LLMServiceAsyncTest(TestCase):
+    """Test suite for the async LLM service entry points"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.test_problema = "Implementar un sistema de IA para automatizar el procesamiento de facturas"
+        # Los análisis se cachean; cada test parte de una caché vacía
+        caches[llm_service.LLM_CACHE_ALIAS].clear()
+        # El modelo de Gemini se comparte entre llamadas; cada test crea el suyo
+        llm_service._obtener_modelo_gemini.cache_clear()
+        # Sin límite de tasa para que los tests no esperen a que se repongan tokens
+        limitadores = patch.multiple(
+            llm_service,
+            _LIMITADOR_CEREBRAS=llm_service._LimitadorTasa(0),
+            _LIMITADOR_GEMINI=llm_service._LimitadorTasa(0),
+        )
+        limitadores.start()
+        self.addCleanup(limitadores.stop)
+        # Clave ficticia: los tests de Gemini no dependen del entorno de quien los ejecuta
+        clave_gemini = patch.dict(os.environ, {'GEMINI_API_KEY': 'test-key'})
+        clave_gemini.start()
+        self.addCleanup(clave_gemini.stop)
+
+    def test_analizar_viabilidad_async_dispatch(self):
+        """Test analizar_viabilidad_async dispatches to the async gemini function"""
+        with patch('core.llm_service.analizar_viabilidad_con_gemini_async', new_callable=AsyncMock) as mock_func:
+            mock_func.return_value = {"titulo_proyecto": "Test"}
+            result = asyncio.run(analizar_viabilidad_async('gemini', self.test_problema))
+            mock_func.assert_awaited_once_with(self.test_problema)
+            self.assertEqual(result["titulo_proyecto"], "Test")
+
+    def test_analizar_viabilidad_async_invalid_model(self):
+        """Test analizar_viabilidad_async with invalid model"""
+        result = asyncio.run(analizar_viabilidad_async('invalid_model', self.test_problema))
+        self.assertIn("Modelo no soportado", result["error"])
+
+    def test_analizar_viabilidad_batch_preserves_order(self):
+        """Test analizar_viabilidad_batch returns one result per problem, in order"""
+        async def fake_analizar(model, problema):
+            return {"titulo_proyecto": problema}
+
+        problemas = [f"{self.test_problema} {i}" for i in range(5)]
+        # Forzamos que el lote falle para comprobar el orden en la ruta individual
+        with patch('core.llm_service._analizar_lote_async', new_callable=AsyncMock, return_value=None), \
+                patch('core.llm_service.analizar_viabilidad_async', side_effect=fake_analizar):
+            results = asyncio.run(analizar_viabilidad_batch('gemini', problemas))
+
+        self.assertEqual([r["titulo_proyecto"] for r in results], problemas)
+
+    @patch('core.llm_service.genai.GenerativeModel')
+    def test_analizar_viabilidad_batch_groups_problems_per_request(self, mock_model_class):
+        """Test that up to five problems are analyzed with a single request and cached"""
+        problemas = [f"{self.test_problema} {i}" for i in range(7)]
+        respuestas_lote = [
+            MagicMock(text=json.dumps({"resultados": [{"titulo_proyecto": p} for p in problemas[:5]]})),
+            MagicMock(text=json.dumps({"resultados": [{"titulo_proyecto": p} for p in problemas[5:]]})),
+        ]
+        mock_model = MagicMock()
+        mock_model.generate_content.side_effect = respuestas_lote
+        mock_model_class.return_value = mock_model
+
+        results = asyncio.run(analizar_viabilidad_batch('gemini', problemas))
+
+        self.assertEqual([r["titulo_proyecto"] for r in results], problemas)
+        self.assertEqual(mock_model.generate_content.call_count, 2)
+        self.assertEqual(caches[llm_service.LLM_CACHE_ALIAS].get(llm_service._clave_cache('gemini', problemas[6])), {"titulo_proyecto": problemas[6]})
+
+    @patch('core.llm_service.genai.GenerativeModel')
+    def test_analizar_viabilidad_batch_falls_back_per_item(self, mock_model_class):
+        """Test that a batch answer with the wrong number of analyses is retried one by one"""
+        problemas = [f"{self.test_problema} {i}" for i in range(2)]
+        respuestas = [
+            MagicMock(text=json.dumps({"resultados": [{"titulo_proyecto": "solo uno"}]})),
+            MagicMock(text='{"titulo_proyecto": "A"}'),
+            MagicMock(text='{"titulo_proyecto": "B"}'),
+        ]
+        mock_model = MagicMock()
+        mock_model.generate_content.side_effect = respuestas
+        mock_model_class.return_value = mock_model
+
+        results = asyncio.run(analizar_viabilidad_batch('gemini', problemas))
+
+        self.assertEqual(sorted(r["titulo_proyecto"] for r in results), ["A", "B"])
+        self.assertEqual(mock_model.generate_content.call_count, 3)
+
+    @patch('core.llm_service.CONCURRENCIA_BATCH', 2)
+    @patch('core.llm_service._analizar_lote_async', new_callable=AsyncMock, return_value=None)
+    def test_analizar_viabilidad_batch_bounds_concurrency(self, mock_lote):
+        """Test that a batch never runs more than CONCURRENCIA_BATCH analyses at once"""
+        problemas = [f"{self.test_problema} {i}" for i in range(6)]
+        en_curso = 0
+        maximo = 0
+
+        async def analisis_lento(model, problema):
+            nonlocal en_curso, maximo
+            en_curso += 1
+            maximo = max(maximo, en_curso)
+            await asyncio.sleep(0.01)
+            en_curso -= 1
+            return {"titulo_proyecto": problema}
+
+        with patch('core.llm_service.analizar_viabilidad_async', side_effect=analisis_lento):
+            results = asyncio.run(analizar_viabilidad_batch('gemini', problemas))
+
+        self.assertEqual([r["titulo_proyecto"] for r in results], problemas)
+        self.assertEqual(maximo, 2)
+
+    @patch('core.llm_service.genai.GenerativeModel')
+    def test_concurrent_identical_async_calls_share_one_request(self, mock_model_class):
+        """Test that identical concurrent async analyses hit the provider once"""
+        mock_response = MagicMock()
+        mock_response.text = '{"titulo_proyecto": "Test"}'
+
+        def slow_call(prompt, stream=False):
+            time.sleep(0.05)
+            return mock_response
+
+        mock_model = MagicMock()
+        mock_model.generate_content.side_effect = slow_call
+        mock_model_class.return_value = mock_model
+
+        results = asyncio.run(analizar_viabilidad_batch('gemini', [self.test_problema] * 3))
+
+        self.assertEqual([r["titulo_proyecto"] for r in results], ["Test"] * 3)
+        self.assertEqual(mock_model.generate_content.call_count, 1)
+
+    @patch('core.llm_service.TIMEOUT_LLM_SEGUNDOS', 0.01)
+    @patch('core.llm_service.genai.GenerativeModel')
+    def test_analizar_viabilidad_con_gemini_async_timeout(self, mock_model_class):
+        """Test that a slow Gemini call is cut off by the timeout"""
+        def slow_call(prompt, stream=False):
+            time.sleep(0.5)
+
+        mock_model = MagicMock()
+        mock_model.generate_content.side_effect = slow_call
+        mock_model_class.return_value = mock_model
+
+        result = asyncio.run(analizar_viabilidad_con_gemini_async(self.test_problema))
+        self.assertIn("error", result)
+        self.assertIn("no respondió", result["error"])
+
+
+class LimitadorTasaTest(TestCase):
+    """Test suite for the per-provider token bucket"""
+
+    def test_allows_burst_up_to_capacity(self):
+        """Test that calls within the per-minute budget do not wait"""
+        limitador = llm_service._LimitadorTasa(3)
+        esperas = [limitador._reservar() for _ in range(3)]
+        self.assertEqual(esperas, [0.0, 0.0, 0.0])
+
+    def test_waits_when_budget_is_exhausted(self):
+        """Test that extra calls are spread out at the refill rate"""
+        limitador = llm_service._LimitadorTasa(60)  # Un token por segundo
+        for _ in range(60):
+            limitador._reservar()
+
+        primera = limitador._reservar()
+        segunda = limitador._reservar()
+
+        self.assertAlmostEqual(primera, 1.0, delta=0.1)
+        self.assertAlmostEqual(segunda, 2.0, delta=0.1)
+
+    def test_zero_disables_the_limit(self):
+        """Test that a limit of 0 never waits"""
+        limitador = llm_service._LimitadorTasa(0)
+        self.assertTrue(all(limitador._reservar() == 0.0 for _ in range(100)))
+
+
+class ParserJSONIncrementalTest(TestCase):
+    """Test suite for the incremental top-level JSON field parser"""
+
+    def test_emits_fields_as_they_complete(self):
+        """Test feeding the JSON one character at a time"""
+        texto = '```json\n{"titulo_proyecto": "Test", "recomendaciones_estrategicas": ["a", "b"], "total": 12}\n```'
+        parser = llm_service._ParserJSONIncremental()
+        campos = []
+        for caracter in texto:
+            campos.extend(parser.alimentar(caracter))
+
+        self.assertEqual(campos, [
+            ("titulo_proyecto", "Test"),
+            ("recomendaciones_estrategicas", ["a", "b"]),
+            ("total", 12),
+        ])
+        self.assertTrue(parser.terminado)
+
+    def test_waits_for_numbers_to_finish(self):
+        """Test that a number at the end of the buffer is not emitted early"""
+        parser = llm_service._ParserJSONIncremental()
+        self.assertEqual(parser.alimentar('{"total": 1'), [])
+        self.assertEqual(parser.alimentar('23'), [])
+        self.assertEqual(parser.alimentar('}'), [("total", 123)])
@@ -1,15 +1,19 @@
+import json
 import pytest
 from django.test import TestCase
 from django.contrib.auth.models import User
+from django.utils import timezone
+from datetime import timedelta
 from core.models import Busqueda
 
 
 class BusquedaModelTest(TestCase):
     """Test suite for Busqueda model"""
 
-    def setUp(self):
-        """Set up test data"""
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data once for the whole class"""
+        cls.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
             password='testpass123'
@@ -55,13 +59,18 @@ class BusquedaModelTest(TestCase):
             'Asistentes conversacionales'
         ]
 
-        for categoria in valid_categorias:
-            busqueda = Busqueda.objects.create(
+        # Una sola inserción para todas las categorías
+        Busqueda.objects.bulk_create([
+            Busqueda(
                 usuario=self.user,
                 texto_problema=f'Test query for {categoria}',
                 categoria=categoria
             )
-            self.assertEqual(busqueda.categoria, categoria)
+            for categoria in valid_categorias
+        ])
+
+        guardadas = Busqueda.objects.values_list('categoria', flat=True)
+        self.assertCountEqual(guardadas, valid_categorias)
 
     def test_busqueda_blank_fields(self):
         """Test Busqueda with blank optional fields"""
@@ -75,14 +84,15 @@ class BusquedaModelTest(TestCase):
 
     def test_busqueda_ordering(self):
         """Test that Busquedas are ordered by fecha_creacion descending"""
-        # Force different timestamps by creating with a small delay
-        import time
         busqueda1 = Busqueda.objects.create(
             usuario=self.user,
             texto_problema='First query',
             categoria='Automatización'
         )
-        time.sleep(0.1)  # Small delay to ensure different timestamps
+        # Backdate the first one instead of sleeping to get distinct timestamps
+        Busqueda.objects.filter(pk=busqueda1.pk).update(
+            fecha_creacion=timezone.now() - timedelta(seconds=1)
+        )
         busqueda2 = Busqueda.objects.create(
             usuario=self.user,
             texto_problema='Second query',
@@ -139,4 +149,38 @@ class BusquedaModelTest(TestCase):
         # Verify JSON can be parsed back
         import json
         parsed_result = json.loads(json.dumps(busqueda.resultado_llm))
-        self.assertEqual(parsed_result['indices_clave']['adecuacion_ia']['puntuacion'], 85)
\ No newline at end of file
+        self.assertEqual(parsed_result['indices_clave']['adecuacion_ia']['puntuacion'], 85)
+
+    def test_busqueda_str_does_not_query_user_per_row(self):
+        """Test that listing searches loads the user in the same query"""
+        for i in range(3):
+            Busqueda.objects.create(usuario=self.user, texto_problema=f'Query {i}')
+
+        with self.assertNumQueries(1):
+            textos = [str(b) for b in Busqueda.objects.all()]
+        self.assertEqual(len(textos), 3)
+
+    def test_busqueda_save_stores_scores(self):
+        """Test that saving copies the key index scores from resultado_llm into their columns"""
+        resultado = json.dumps({
+            "indices_clave": {
+                "adecuacion_ia": {"puntuacion": 85},
+                "factibilidad_tecnica": {"puntuacion": 90},
+                "impacto_potencial": {"puntuacion": 80}
+            }
+        })
+        busqueda = Busqueda.objects.create(usuario=self.user, texto_problema='Scored query', resultado_llm=resultado)
+        busqueda.refresh_from_db()
+
+        self.assertEqual(busqueda.puntuacion_adecuacion, 85)
+        self.assertEqual(busqueda.puntuacion_factibilidad, 90)
+        self.assertEqual(busqueda.puntuacion_impacto, 80)
+        self.assertEqual(busqueda.puntuacion_media, 85)
+
+    def test_busqueda_save_without_scores(self):
+        """Test that searches without a scored analysis keep empty score columns"""
+        for resultado in (None, '', 'no es JSON', '{"test": "result"}'):
+            busqueda = Busqueda.objects.create(usuario=self.user, texto_problema='Unscored', resultado_llm=resultado)
+            self.assertIsNone(busqueda.puntuacion_adecuacion)
+            self.assertIsNone(busqueda.puntuacion_impacto)
+            self.assertIsNone(busqueda.puntuacion_media)
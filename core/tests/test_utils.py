@@ -4,7 +4,8 @@ from core.utils import (
     validar_categoria,
     formatear_fecha,
     calcular_promedio_puntuaciones,
-    sanitizar_texto
+    sanitizar_texto,
+    clasificar_consulta
 )
 
 
@@ -105,6 +106,11 @@ class UtilsTest(TestCase):
         self.assertIn('Hola', resultado)
         self.assertIn('mundo', resultado)
 
+    def test_sanitizar_texto_removes_dangerous_chars(self):
+        """Test that quotes, backslashes and semicolons are removed from ASCII and non-ASCII text"""
+        self.assertEqual(sanitizar_texto("it's \"ok\"; a\\b"), "its ok ab")
+        self.assertEqual(sanitizar_texto("análisis 'rápido'; año\\2024"), "análisis rápido año2024")
+
     def test_sanitizar_texto_empty(self):
         """Test sanitizar_texto with empty input"""
         resultado = sanitizar_texto("")
@@ -155,4 +161,13 @@ class UtilsTest(TestCase):
 
         # Should not contain dangerous SQL
         self.assertNotIn('DROP', resultado.upper())
-        self.assertNotIn('TABLE', resultado.upper())
\ No newline at end of file
+        self.assertNotIn('TABLE', resultado.upper())
+
+    def test_clasificar_consulta_memoizes_repeated_texts(self):
+        """Test that classifying the same text twice reuses the first result"""
+        clasificar_consulta.cache_clear()
+        texto = 'Crear un chatbot para soporte al cliente'
+
+        self.assertEqual(clasificar_consulta(texto), 'Asistentes conversacionales')
+        self.assertEqual(clasificar_consulta(texto), 'Asistentes conversacionales')
+        self.assertEqual(clasificar_consulta.cache_info().hits, 1)
@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from core.utils import (
+    clasificar_consulta,
+    sanitizar_texto,
+    calcular_promedio_puntuaciones
+)
+
+# Typical problem description, long enough to exercise every keyword scan
+LONG_SPANISH_TEXT = (
+    "Somos una empresa mediana de distribución con varias sucursales y queremos "
+    "gestionar mejor el inventario, reducir las roturas de stock y coordinar los "
+    "pedidos entre almacenes sin contratar más personal. "
+) * 4
+
+DIRTY_TEXT = "<p>Quiero <b>automatizar</b> la facturación'; DROP TABLE clientes; --</p> " * 8
+
+
+def test_clasificar_consulta_no_match(benchmark):
+    """Benchmark the worst case: no keyword matches and every category is scanned"""
+    # Bypass the memoization so every round does the full scan
+    benchmark(clasificar_consulta.__wrapped__, LONG_SPANISH_TEXT)
+
+
+def test_clasificar_consulta_early_match(benchmark):
+    """Benchmark a text that matches the highest-priority category"""
+    benchmark(clasificar_consulta.__wrapped__, "Crear un chatbot para soporte al cliente")
+
+
+def test_sanitizar_texto(benchmark):
+    """Benchmark sanitizing a text with HTML, SQL keywords and quotes"""
+    benchmark(sanitizar_texto, DIRTY_TEXT)
+
+
+@pytest.mark.parametrize("n", [3, 1000])
+def test_calcular_promedio_puntuaciones(benchmark, n):
+    """Benchmark averaging a short and a long list of scores with gaps"""
+    puntuaciones = [None if i % 5 == 0 else 80 + i % 20 for i in range(n)]
+    benchmark(calcular_promedio_puntuaciones, puntuaciones)
@@ -1,24 +1,77 @@
 import pytest
 import json
-from django.test import TestCase, Client
+from datetime import timedelta
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
 from unittest.mock import patch, MagicMock
+from core import views
 from core.models import Busqueda
 
 
+# Analysis returned by the mocked LLM service in every test
+MOCK_RESULT = {
+    "titulo_proyecto": "Test Project",
+    "resumen_ejecutivo": "Test summary",
+    "indices_clave": {
+        "adecuacion_ia": {"puntuacion": 85, "justificacion": "Good fit"},
+        "factibilidad_tecnica": {"puntuacion": 90, "justificacion": "Technically feasible"},
+        "impacto_potencial": {"puntuacion": 80, "justificacion": "High impact"}
+    }
+}
+
+# Complete stored analysis, serialized once at import
+MOCK_RESULTADO_JSON = json.dumps({
+    "resumen_ejecutivo": "Test summary",
+    "indices_clave": {
+        "adecuacion_ia": {"puntuacion": 85, "justificacion": "Good fit"},
+        "factibilidad_tecnica": {"puntuacion": 90, "justificacion": "Technically feasible"},
+        "impacto_potencial": {"puntuacion": 80, "justificacion": "High impact"}
+    },
+    "analisis_costo_beneficio": "Cost-benefit analysis",
+    "alternativas_no_ia": "Non-AI alternatives",
+    "recomendaciones_estrategicas": ["Recommendation 1", "Recommendation 2"],
+    "consultas_relacionadas": [
+        {
+            "titulo": "Test title",
+            "descripcion": "Test description",
+            "consulta_completa": "Test full query"
+        }
+    ]
+})
+
+# In-memory caches so the tests never reach a configured Redis
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'llm': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'llm-tests'},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
 class CoreViewsTest(TestCase):
     """Test suite for core app views"""
 
-    def setUp(self):
-        """Set up test data"""
-        self.client = Client()
-        self.user = User.objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        """Set up test data once for the whole class"""
+        cls.user = User.objects.create_user(
             username='testuser',
             email='test@example.com',
             password='testpass123'
         )
-        self.client.login(username='testuser', password='testpass123')
+        # Owner of the searches the test user must not be able to see;
+        # its password is never used, so it is not hashed
+        cls.other_user = User.objects.create(username='otheruser', email='other@example.com')
+
+    def setUp(self):
+        """Log the test user in and mock the LLM service for every test"""
+        self.client = Client()
+        self.client.force_login(self.user)
+        # No test in this class may call the real LLM providers
+        patcher = patch('core.views.analizar_viabilidad', return_value=MOCK_RESULT)
+        self.mock_analizar = patcher.start()
+        self.addCleanup(patcher.stop)
 
     def test_home_view_get(self):
         """Test home view GET request"""
@@ -28,28 +81,38 @@ class CoreViewsTest(TestCase):
 
     def test_home_view_post_valid(self):
         """Test home view POST request with valid data"""
-        # Mock the LLM service to avoid API key issues
-        with patch('core.views.analizar_viabilidad') as mock_analizar:
-            mock_result = {
-                "titulo_proyecto": "Test Project",
-                "resumen_ejecutivo": "Test summary",
-                "indices_clave": {
-                    "adecuacion_ia": {"puntuacion": 85, "justificacion": "Good fit"},
-                    "factibilidad_tecnica": {"puntuacion": 90, "justificacion": "Technically feasible"},
-                    "impacto_potencial": {"puntuacion": 80, "justificacion": "High impact"}
-                }
-            }
-            mock_analizar.return_value = mock_result
-
-            data = {'problema': 'Test AI analysis query'}
-            response = self.client.post(reverse('core:home'), data)
-            self.assertEqual(response.status_code, 302)  # Redirect to resultado
-
-            # Check that Busqueda was created
-            busqueda = Busqueda.objects.filter(texto_problema='Test AI analysis query').first()
-            self.assertIsNotNone(busqueda)
-            if busqueda:
-                self.assertEqual(busqueda.usuario, self.user)
+        data = {'problema': 'Test AI analysis query'}
+        response = self.client.post(reverse('core:home'), data)
+        self.assertEqual(response.status_code, 302)  # Redirect to resultado
+        self.mock_analizar.assert_called_once()
+
+        # Check that Busqueda was created
+        busqueda = Busqueda.objects.filter(texto_problema='Test AI analysis query').first()
+        self.assertIsNotNone(busqueda)
+        if busqueda:
+            self.assertEqual(busqueda.usuario, self.user)
+
+    def test_analizar_stream_view(self):
+        """Test the streaming view emits field events and saves the search at the end"""
+        eventos = [
+            ("campo", {"clave": "titulo_proyecto", "valor": "Test Project"}),
+            ("resultado", {"titulo_proyecto": "Test Project"}),
+        ]
+        with patch('core.views.analizar_viabilidad_stream', return_value=iter(eventos)):
+            response = self.client.post(reverse('core:analizar_stream'), {'problema': 'Test AI analysis query'})
+            contenido = b''.join(response.streaming_content).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn('event: campo', contenido)
+        self.assertIn('Test Project', contenido)
+        busqueda = Busqueda.objects.get(texto_problema='Test AI analysis query')
+        fin = contenido.split('event: fin\ndata: ', 1)[1].split('\n\n', 1)[0]
+        self.assertEqual(json.loads(fin)['busqueda_id'], busqueda.id)
+
+    def test_analizar_stream_view_short_problem(self):
+        """Test the streaming view rejects too short descriptions"""
+        response = self.client.post(reverse('core:analizar_stream'), {'problema': 'corto'})
+        self.assertEqual(response.status_code, 400)
 
     def test_home_view_post_empty(self):
         """Test home view POST request with empty data"""
@@ -57,6 +120,16 @@ class CoreViewsTest(TestCase):
         response = self.client.post(reverse('core:home'), data)
         self.assertEqual(response.status_code, 302)  # Redirect to home with error
 
+    def test_home_view_post_service_exception(self):
+        """Test that an unexpected service failure is logged with its traceback"""
+        self.mock_analizar.side_effect = Exception("API Error")
+        with self.assertLogs('core.views', level='ERROR') as logs:
+            response = self.client.post(reverse('core:home'), {'problema': 'Test AI analysis query'})
+
+        self.assertRedirects(response, reverse('core:home'))
+        self.assertIn('Traceback', logs.output[0])
+        self.assertFalse(Busqueda.objects.filter(texto_problema='Test AI analysis query').exists())
+
     def test_analizar_viabilidad_success(self):
         """Test analizar_viabilidad view with successful LLM response"""
         # Create a busqueda first
@@ -81,14 +154,8 @@ class CoreViewsTest(TestCase):
 
     def test_analizar_viabilidad_not_owner(self):
         """Test resultado view with different user"""
-        other_user = User.objects.create_user(
-            username='otheruser',
-            email='other@example.com',
-            password='otherpass123'
-        )
-
         busqueda = Busqueda.objects.create(
-            usuario=other_user,
+            usuario=self.other_user,
             texto_problema='Test query',
             categoria='Automatización'
         )
@@ -98,47 +165,24 @@ class CoreViewsTest(TestCase):
 
     def test_resultado_view_with_data(self):
         """Test resultado view with complete busqueda data"""
-        mock_resultado = {
-            "resumen_ejecutivo": "Test summary",
-            "indices_clave": {
-                "adecuacion_ia": {"puntuacion": 85, "justificacion": "Good fit"},
-                "factibilidad_tecnica": {"puntuacion": 90, "justificacion": "Technically feasible"},
-                "impacto_potencial": {"puntuacion": 80, "justificacion": "High impact"}
-            },
-            "analisis_costo_beneficio": "Cost-benefit analysis",
-            "alternativas_no_ia": "Non-AI alternatives",
-            "recomendaciones_estrategicas": ["Recommendation 1", "Recommendation 2"],
-            "consultas_relacionadas": [
-                {
-                    "titulo": "Test title",
-                    "descripcion": "Test description",
-                    "consulta_completa": "Test full query"
-                }
-            ]
-        }
-
         busqueda = Busqueda.objects.create(
             usuario=self.user,
             texto_problema='Test query',
             categoria='Automatización',
-            resultado_llm=json.dumps(mock_resultado)
+            resultado_llm=MOCK_RESULTADO_JSON
         )
 
         response = self.client.get(reverse('core:resultado', args=[busqueda.id]))
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'core/resultado.html')
         self.assertContains(response, 'Test summary')
+        # (85 + 90 + 80) / 3, stored on the search when it was saved
+        self.assertEqual(response.context['resultado']['average_viability'], 85)
 
     def test_resultado_view_not_owner(self):
         """Test resultado view with different user"""
-        other_user = User.objects.create_user(
-            username='otheruser',
-            email='other@example.com',
-            password='otherpass123'
-        )
-
         busqueda = Busqueda.objects.create(
-            usuario=other_user,
+            usuario=self.other_user,
             texto_problema='Test query',
             categoria='Automatización'
         )
@@ -148,23 +192,128 @@ class CoreViewsTest(TestCase):
 
     def test_historial_view(self):
         """Test historial view"""
-        # Create some busquedas
+        # Create some busquedas in a single INSERT
+        Busqueda.objects.bulk_create([
+            Busqueda(
+                usuario=self.user,
+                texto_problema='Query 1',
+                categoria='Automatización'
+            ),
+            Busqueda(
+                usuario=self.user,
+                texto_problema='Query 2',
+                categoria='Análisis de datos / predicción'
+            ),
+        ])
+
+        response = self.client.get(reverse('core:historial'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'core/historial.html')
+        self.assertContains(response, 'Query 1')
+        self.assertContains(response, 'Query 2')
+
+    def test_historial_view_query_count(self):
+        """Test that the history page runs one query for the list and one for the category stats"""
+        Busqueda.objects.bulk_create([
+            Busqueda(usuario=self.user, texto_problema=f'Query {i}', categoria='Automatización')
+            for i in range(3)
+        ])
+        # Session and user lookups for the logged-in request, then list and stats
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('core:historial'))
+        self.assertEqual(response.context['estadisticas_categoria'][0]['porcentaje'], 100)
+
+    def test_historial_view_defers_llm_result(self):
+        """Test that the history list does not load the stored analysis"""
         Busqueda.objects.create(
             usuario=self.user,
             texto_problema='Query 1',
-            categoria='Automatización'
-        )
-        Busqueda.objects.create(
-            usuario=self.user,
-            texto_problema='Query 2',
-            categoria='Análisis de datos / predicción'
+            resultado_llm={'resumen_problema': 'Resumen'}
         )
 
         response = self.client.get(reverse('core:historial'))
+        consulta = response.context['consultas'][0]
+        self.assertIn('resultado_llm', consulta.get_deferred_fields())
+
+    @override_settings(ANALISIS_EN_SEGUNDO_PLANO=True)
+    def test_home_view_post_background(self):
+        """Test that background mode stores a pending search and queues the analysis after commit"""
+        problema = 'Test AI analysis query'
+        with patch('core.views._EJECUTOR_ANALISIS') as mock_ejecutor:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('core:home'), {'problema': problema})
+
+        busqueda = Busqueda.objects.get(texto_problema=problema)
+        self.assertRedirects(response, reverse('core:resultado', args=[busqueda.id]), fetch_redirect_response=False)
+        self.assertIsNone(busqueda.resultado_llm)
+        self.assertEqual(busqueda.estado, 'pendiente')
+        self.mock_analizar.assert_not_called()
+        mock_ejecutor.submit.assert_called_once_with(
+            views._analizar_en_segundo_plano, busqueda.id, 'gemini', problema
+        )
+
+    def test_resultado_view_pending(self):
+        """Test that a search still being analyzed shows the waiting page"""
+        busqueda = Busqueda.objects.create(usuario=self.user, texto_problema='Pending query', estado='pendiente')
+
+        response = self.client.get(reverse('core:resultado', args=[busqueda.id]))
+        self.assertEqual(response.status_code, 202)
+        self.assertTemplateUsed(response, 'core/procesando.html')
+        self.assertEqual(response.context['siguiente_intento'], 1)
+        self.assertContains(response, '?intento=1', status_code=202)
+
+    def test_resultado_view_pending_stops_polling(self):
+        """Test that the waiting page stops reloading after the last attempt"""
+        busqueda = Busqueda.objects.create(usuario=self.user, texto_problema='Pending query', estado='pendiente')
+
+        url = reverse('core:resultado', args=[busqueda.id])
+        response = self.client.get(url, {'intento': views.INTENTOS_ESPERA_MAXIMOS})
+        self.assertEqual(response.status_code, 202)
+        self.assertIsNone(response.context['siguiente_intento'])
+        self.assertNotContains(response, 'window.location', status_code=202)
+
+    @override_settings(ANALISIS_TIEMPO_MAXIMO=60)
+    def test_resultado_view_pending_expired(self):
+        """Test that a search pending past the time limit is reported as failed without deleting it"""
+        busqueda = Busqueda.objects.create(usuario=self.user, texto_problema='Pending query', estado='pendiente')
+        Busqueda.objects.filter(id=busqueda.id).update(fecha_creacion=timezone.now() - timedelta(seconds=61))
+
+        response = self.client.get(reverse('core:resultado', args=[busqueda.id]))
+        self.assertRedirects(response, reverse('core:home'))
+        self.assertTrue(Busqueda.objects.filter(id=busqueda.id, estado='pendiente').exists())
+
+    def test_completar_analisis_stores_result(self):
+        """Test that a completed background analysis is stored with its scores"""
+        busqueda = Busqueda.objects.create(usuario=self.user, texto_problema='Pending query', estado='pendiente')
+
+        views._completar_analisis(busqueda.id, 'gemini', 'Pending query')
+
+        busqueda.refresh_from_db()
+        self.assertEqual(busqueda.estado, 'completada')
+        self.assertEqual(json.loads(busqueda.resultado_llm), MOCK_RESULT)
+        self.assertEqual(busqueda.puntuacion_media, 85)
+        response = self.client.get(reverse('core:resultado', args=[busqueda.id]))
         self.assertEqual(response.status_code, 200)
-        self.assertTemplateUsed(response, 'core/historial.html')
-        self.assertContains(response, 'Query 1')
-        self.assertContains(response, 'Query 2')
+
+    def test_completar_analisis_error(self):
+        """Test that a failed background analysis is marked by the worker and left out of the history"""
+        # The service either raises or returns an error dict (e.g. on timeout)
+        for side_effect, return_value in ((Exception("API Error"), None), (None, {'error': 'Timeout'})):
+            with self.subTest(side_effect=side_effect, return_value=return_value):
+                self.mock_analizar.side_effect = side_effect
+                self.mock_analizar.return_value = return_value
+                busqueda = Busqueda.objects.create(usuario=self.user, texto_problema='Pending query', estado='pendiente')
+
+                views._completar_analisis(busqueda.id, 'gemini', 'Pending query')
+
+                busqueda.refresh_from_db()
+                self.assertEqual(busqueda.estado, 'error')
+                self.assertIsNone(busqueda.resultado_llm)
+                response = self.client.get(reverse('core:resultado', args=[busqueda.id]))
+                self.assertRedirects(response, reverse('core:home'))
+                self.assertTrue(Busqueda.objects.filter(id=busqueda.id).exists())
+                response = self.client.get(reverse('core:historial'))
+                self.assertNotIn(busqueda, response.context['consultas'])
 
     def test_unauthenticated_access(self):
         """Test that unauthenticated users are redirected"""
@@ -1,11 +1,33 @@
 from django.urls import path
-from . import views
+from django.utils.module_loading import import_string
 
 app_name = 'core'
 
+
+def _vista_diferida(ruta):
+    """
+    Devuelve una vista que importa `ruta` en la primera petición.
+
+    core.views arrastra los SDK de Gemini y Cerebras (cerca de un segundo de
+    importación); así los comandos de manage.py y el autoreload de runserver,
+    que cargan el URLconf para las comprobaciones del sistema, no pagan ese
+    coste hasta que llega una petición real.
+    """
+    vista = None
+
+    def despachar(request, *args, **kwargs):
+        nonlocal vista
+        if vista is None:
+            vista = import_string(ruta)
+        return vista(request, *args, **kwargs)
+
+    return despachar
+
+
 urlpatterns = [
-    path('', views.home, name='home'),
-    path('resultado/<int:busqueda_id>/', views.resultado, name='resultado'),
-    path('historial/', views.historial, name='historial'),
-    path('borrar/<int:busqueda_id>/', views.borrar_consulta, name='borrar_consulta'),
-]
\ No newline at end of file
+    path('', _vista_diferida('core.views.home'), name='home'),
+    path('analizar/stream/', _vista_diferida('core.views.analizar_stream'), name='analizar_stream'),
+    path('resultado/<int:busqueda_id>/', _vista_diferida('core.views.resultado'), name='resultado'),
+    path('historial/', _vista_diferida('core.views.historial'), name='historial'),
+    path('borrar/<int:busqueda_id>/', _vista_diferida('core.views.borrar_consulta'), name='borrar_consulta'),
+]
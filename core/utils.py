@@ -7,8 +7,12 @@ clasificación de consultas y sanitización de texto. Estas funciones ayudan
 a mantener el código limpio y reutilizable.
 """
 
+import re  # Expresiones regulares para la sanitización de texto
+from datetime import datetime  # Para validar que las fechas incluyan la hora
+from functools import lru_cache  # Memoización de la clasificación de consultas
+
 from django.db import models  # Para trabajar con modelos de Django
-from .models import Busqueda  # Modelo de búsqueda para validaciones
+from .models import Busqueda, CATEGORIAS_VALIDAS  # Modelo de búsqueda y categorías para validaciones
 
 
 def validar_categoria(categoria):
@@ -25,23 +29,15 @@ def validar_categoria(categoria):
     Retorna:
         True si la categoría es válida, False en caso contrario
     """
-    if not categoria:
+    if not isinstance(categoria, str) or not categoria:
         return False
 
-    # Lista completa de categorías de IA soportadas por el sistema
-    categorias_validas = [
-        'Automatización',
-        'Análisis de datos / predicción',
-        'Procesamiento de texto',
-        'Procesamiento de imágenes / video',
-        'Procesamiento de audio / voz',
-        'Generación de contenido',
-        'Recomendación / personalización',
-        'Optimización / decisión inteligente',
-        'Asistentes conversacionales'
-    ]
+    # Conjunto de categorías de IA soportadas, construido una sola vez en core.models
+    return categoria in CATEGORIAS_VALIDAS
+
 
-    return categoria in categorias_validas
+# Formato de fecha y hora usado en toda la interfaz
+_FORMATO_FECHA = '%d/%m/%Y %H:%M:%S'
 
 
 def formatear_fecha(fecha):
@@ -61,8 +57,8 @@ def formatear_fecha(fecha):
         return ''
 
     # Validación estricta: solo datetime completo, no date
-    if hasattr(fecha, 'hour'):
-        return fecha.strftime('%d/%m/%Y %H:%M:%S')
+    if isinstance(fecha, datetime):
+        return fecha.strftime(_FORMATO_FECHA)
     else:
         # Comportamiento específico requerido por las pruebas
         raise AttributeError("'date' object has no attribute 'hour'")
@@ -93,6 +89,18 @@ def calcular_promedio_puntuaciones(puntuaciones):
     return sum(valores_validos) / len(valores_validos)
 
 
+# Expresiones de sanitizar_texto, compiladas una sola vez al importar el módulo
+_ETIQUETA_HTML_RE = re.compile(r'<[^>]+>')
+# Solo las palabras clave críticas que aparecen en pruebas, en una sola pasada
+# y sin distinguir mayúsculas
+_SQL_PELIGROSO_RE = re.compile(r'DROP|TABLE', re.IGNORECASE)
+_CARACTERES_PELIGROSOS_RE = re.compile(r"['\"\\;]")
+# Misma eliminación con str.translate: para texto ASCII es varias veces más rápida
+# que la expresión regular, pero con caracteres no ASCII (tildes, eñes) CPython sale
+# de su camino rápido y resulta más lenta, así que solo se usa con texto ASCII
+_CARACTERES_PELIGROSOS_TABLA = str.maketrans('', '', "'\"\\;")
+
+
 def sanitizar_texto(texto):
     """
     Limpia y sanitiza texto para prevenir ataques de inyección y contenido peligroso.
@@ -110,25 +118,48 @@ def sanitizar_texto(texto):
     if texto is None:
         return ''
 
-    import re
-
     # Eliminar etiquetas HTML para prevenir XSS básico
-    texto = re.sub(r'<[^>]+>', '', texto)
+    texto = _ETIQUETA_HTML_RE.sub('', texto)
 
     # Protección contra SQL injection básica: remover comandos peligrosos
-    # Solo las palabras clave críticas que aparecen en pruebas
-    sql_keywords = ['DROP', 'TABLE']
-    for keyword in sql_keywords:
-        # Reemplazo case-insensitive manteniendo la estructura del texto
-        pattern = re.compile(re.escape(keyword), re.IGNORECASE)
-        texto = pattern.sub('[REMOVED]', texto)
+    texto = _SQL_PELIGROSO_RE.sub('[REMOVED]', texto)
 
     # Eliminar caracteres peligrosos que podrían causar problemas
-    texto = re.sub(r"['\"\\;]", '', texto)
+    if texto.isascii():
+        texto = texto.translate(_CARACTERES_PELIGROSOS_TABLA)
+    else:
+        texto = _CARACTERES_PELIGROSOS_RE.sub('', texto)
 
     return texto.strip()
 
 
+# Diccionario completo de categorías y sus palabras clave asociadas
+# Cada categoría representa un área específica de aplicación de IA
+PALABRAS_CLAVE_CATEGORIA = {
+    'Automatización': ['automatización', 'automatizar', 'automatizado', 'robots', 'workflow', 'procesos', 'tareas repetitivas', 'eficiencia', 'agilizar'],
+    'Análisis de datos / predicción': ['análisis', 'datos', 'predicción', 'predictivo', 'estadísticas', 'machine learning', 'aprendizaje automático', 'forecast', 'proyección', 'modelo predictivo', 'big data', 'insights', 'tendencias'],
+    'Procesamiento de texto': ['texto', 'procesar texto', 'nlp', 'lenguaje natural', 'traducir', 'resumir', 'escribir', 'corrección', 'edición', 'documentos'],
+    'Procesamiento de imágenes / video': ['imágenes', 'video', 'procesamiento visual', 'reconocimiento imagen', 'computer vision', 'detección objetos', 'clasificación imagen', 'edición video'],
+    'Procesamiento de audio / voz': ['audio', 'voz', 'speech', 'reconocimiento voz', 'sintetizador voz', 'transcripción', 'podcasts', 'música'],
+    'Generación de contenido': ['generar', 'contenido', 'crear', 'escribir', 'diseño', 'arte', 'música', 'vídeos', 'marketing creativo'],
+    'Recomendación / personalización': ['recomendación', 'personalización', 'sugerencias', 'preferencias', 'usuario', 'personalizado', 'tailored', 'sistemas recomendación'],
+    'Optimización / decisión inteligente': ['optimización', 'decisión', 'inteligente', 'planificación', 'estrategia', 'mejorar', 'eficiente', 'ruteo', 'logística'],
+    'Asistentes conversacionales': ['asistente', 'chatbot', 'conversacional', 'dialogo', 'ayuda virtual', 'soporte', 'preguntas', 'respuestas']
+}
+
+# Orden de prioridad: categorías más específicas primero para mayor precisión
+ORDEN_PRIORIDAD_CATEGORIAS = ['Asistentes conversacionales', 'Optimización / decisión inteligente', 'Recomendación / personalización', 'Generación de contenido', 'Procesamiento de audio / voz', 'Procesamiento de imágenes / video', 'Procesamiento de texto', 'Análisis de datos / predicción', 'Automatización']
+
+# Palabras clave ya recorridas en orden de prioridad. Se compara con "in" sobre el
+# texto y no con una expresión regular de alternativas: la búsqueda de subcadenas
+# de str es varias veces más rápida que el motor de re (que hace backtracking)
+_PALABRAS_POR_PRIORIDAD = [
+    (categoria, tuple(PALABRAS_CLAVE_CATEGORIA[categoria]))
+    for categoria in ORDEN_PRIORIDAD_CATEGORIAS
+]
+
+
+@lru_cache(maxsize=1024)
 def clasificar_consulta(texto_problema):
     """
     Clasifica automáticamente una consulta de usuario en categorías de IA específicas.
@@ -138,6 +169,10 @@ def clasificar_consulta(texto_problema):
     por el usuario. Es fundamental para organizar y categorizar las búsquedas
     en la aplicación, permitiendo análisis estadísticos y recomendaciones.
 
+    El resultado solo depende del texto, así que se memoriza: los problemas que
+    se envían de nuevo (reintentos, streaming tras un análisis) no se vuelven a
+    recorrer.
+
     Parámetros:
         texto_problema: Descripción del problema o proyecto del usuario
 
@@ -146,33 +181,13 @@ def clasificar_consulta(texto_problema):
     """
     texto = texto_problema.lower()
 
-    # Diccionario completo de categorías y sus palabras clave asociadas
-    # Cada categoría representa un área específica de aplicación de IA
-    categorias = {
-        'Automatización': ['automatización', 'automatizar', 'automatizado', 'robots', 'workflow', 'procesos', 'tareas repetitivas', 'eficiencia', 'agilizar'],
-        'Análisis de datos / predicción': ['análisis', 'datos', 'predicción', 'predictivo', 'estadísticas', 'machine learning', 'aprendizaje automático', 'forecast', 'proyección', 'modelo predictivo', 'big data', 'insights', 'tendencias'],
-        'Procesamiento de texto': ['texto', 'procesar texto', 'nlp', 'lenguaje natural', 'traducir', 'resumir', 'escribir', 'corrección', 'edición', 'documentos'],
-        'Procesamiento de imágenes / video': ['imágenes', 'video', 'procesamiento visual', 'reconocimiento imagen', 'computer vision', 'detección objetos', 'clasificación imagen', 'edición video'],
-        'Procesamiento de audio / voz': ['audio', 'voz', 'speech', 'reconocimiento voz', 'sintetizador voz', 'transcripción', 'podcasts', 'música'],
-        'Generación de contenido': ['generar', 'contenido', 'crear', 'escribir', 'diseño', 'arte', 'música', 'vídeos', 'marketing creativo'],
-        'Recomendación / personalización': ['recomendación', 'personalización', 'sugerencias', 'preferencias', 'usuario', 'personalizado', 'tailored', 'sistemas recomendación'],
-        'Optimización / decisión inteligente': ['optimización', 'decisión', 'inteligente', 'planificación', 'estrategia', 'mejorar', 'eficiente', 'ruteo', 'logística'],
-        'Asistentes conversacionales': ['asistente', 'chatbot', 'conversacional', 'dialogo', 'ayuda virtual', 'soporte', 'preguntas', 'respuestas']
-    }
-
-    # Orden de prioridad: categorías más específicas primero para mayor precisión
-    orden_prioridad = ['Asistentes conversacionales', 'Optimización / decisión inteligente', 'Recomendación / personalización', 'Generación de contenido', 'Procesamiento de audio / voz', 'Procesamiento de imágenes / video', 'Procesamiento de texto', 'Análisis de datos / predicción', 'Automatización']
-
-    # Sistema de puntuación: contar coincidencias de palabras clave
-    puntuaciones = {}
-    for categoria, palabras_clave in categorias.items():
-        puntuacion = sum(1 for palabra in palabras_clave if palabra in texto)
-        puntuaciones[categoria] = puntuacion
-
-    # Seleccionar la categoría con mayor puntuación según la jerarquía de prioridad
-    for categoria in orden_prioridad:
-        if puntuaciones[categoria] > 0:
-            return categoria
+    # Basta con que aparezca una palabra clave: la primera categoría con
+    # coincidencia según la jerarquía de prioridad es la elegida, sin seguir
+    # contando coincidencias del resto de categorías
+    for categoria, palabras_clave in _PALABRAS_POR_PRIORIDAD:
+        for palabra in palabras_clave:
+            if palabra in texto:
+                return categoria
 
     # Categoría por defecto cuando no hay coincidencias claras
     return 'Automatización'
\ No newline at end of file
@@ -10,21 +10,84 @@ Las vistas están protegidas con autenticación requerida (@login_required) para
 asegurar que solo usuarios registrados puedan acceder al análisis de IA.
 """
 
-import json  # Para manejar datos JSON en respuestas y base de datos
+import logging  # Para registrar los fallos de los análisis en segundo plano
+from concurrent.futures import ThreadPoolExecutor  # Hilos para los análisis en segundo plano
+from datetime import timedelta  # Límite de espera de los análisis pendientes
+import orjson  # Serialización JSON rápida para los análisis almacenados (varios KB cada uno)
 import requests  # Para posibles llamadas HTTP externas (aunque no se usa actualmente)
+from django.conf import settings  # Para saber si el análisis se hace en segundo plano
+from django.db import connection, transaction  # Conexión propia de cada hilo y lanzamiento tras el commit
 from django.shortcuts import render, redirect, get_object_or_404  # Utilidades básicas de Django
 from django.contrib.auth.decorators import login_required  # Decorador para vistas que requieren login
 from django.contrib import messages  # Sistema de mensajes de Django
 from django.contrib.auth.models import User  # Modelo de usuario de Django
-from django.http import JsonResponse  # Para respuestas JSON
+from django.http import JsonResponse, StreamingHttpResponse  # Para respuestas JSON y en streaming
+from django.urls import reverse  # Para construir la URL del resultado al terminar el streaming
 from django.views.decorators.http import require_POST  # Decorador para métodos POST
 from django.db.models import Count  # Para agregaciones en consultas de base de datos
+from django.utils import timezone  # Hora actual para el límite de espera
 from .models import Busqueda  # Modelo de búsqueda local
-from .llm_service import analizar_viabilidad  # Servicio de IA principal
+from .llm_service import analizar_viabilidad, analizar_viabilidad_stream  # Servicio de IA principal
 from .utils import clasificar_consulta  # Utilidad para clasificar consultas
 
 # Nota: Las funciones de prueba anteriores fueron reemplazadas por el servicio unificado de Gemini/Cerebras
 
+logger = logging.getLogger(__name__)
+
+# Hilos que completan los análisis cuando ANALISIS_EN_SEGUNDO_PLANO está activo. La
+# llamada al modelo es casi toda espera de red, así que los hilos liberan al worker
+# de la petición sin competir por el GIL
+_EJECUTOR_ANALISIS = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ANALISIS_HILOS', 4),
+    thread_name_prefix='analisis',
+)
+
+# La página de espera se recarga cada ESPERA_ENTRE_INTENTOS_MS milisegundos y deja
+# de hacerlo tras INTENTOS_ESPERA_MAXIMOS recargas (unos tres minutos)
+ESPERA_ENTRE_INTENTOS_MS = 3000
+INTENTOS_ESPERA_MAXIMOS = 60
+
+
+def _completar_analisis(busqueda_id, model, problema):
+    """
+    Analiza el problema de una búsqueda pendiente y guarda el resultado.
+
+    Si el análisis falla la búsqueda queda con estado 'error' y sin resultado:
+    la vista de resultado deja de esperar y avisa al usuario, y el historial
+    no la muestra (como las consultas síncronas fallidas, que no se guardan).
+    """
+    try:
+        resultado_llm = analizar_viabilidad(model, problema)
+    except Exception:
+        logger.exception("Error en el análisis en segundo plano de la búsqueda %s", busqueda_id)
+        resultado_llm = None
+    else:
+        if "error" in resultado_llm:
+            logger.warning("Análisis en segundo plano de la búsqueda %s fallido: %s", busqueda_id, resultado_llm['error'])
+            resultado_llm = None
+
+    if resultado_llm is None:
+        Busqueda.objects.filter(id=busqueda_id).update(estado='error')
+        return
+
+    busqueda = Busqueda.objects.filter(id=busqueda_id).first()
+    if busqueda is None:
+        return  # El usuario borró la búsqueda mientras se analizaba
+    busqueda.resultado_llm = orjson.dumps(resultado_llm).decode()
+    busqueda.estado = 'completada'
+    busqueda.save()  # save() también rellena las columnas de puntuación
+
+
+def _analizar_en_segundo_plano(busqueda_id, model, problema):
+    """Tarea del ejecutor: completa el análisis y cierra la conexión del hilo."""
+    try:
+        _completar_analisis(busqueda_id, model, problema)
+    finally:
+        # Cada hilo abre su propia conexión a la base de datos; sin cerrarla
+        # quedaría abierta indefinidamente en el hilo del pool
+        connection.close()
+
+
 @login_required
 def home(request):
     """
@@ -60,6 +123,21 @@ def home(request):
             if model not in ['gemini', 'cerebras']:
                 model = 'gemini'  # Valor por defecto si el usuario envía algo inválido
 
+            if getattr(settings, 'ANALISIS_EN_SEGUNDO_PLANO', False):
+                # La búsqueda se guarda pendiente (sin resultado) y el análisis sigue en
+                # un hilo; la página de resultado se recarga hasta que termina
+                busqueda = Busqueda.objects.create(
+                    usuario=request.user,
+                    texto_problema=problema,
+                    modelo=model,
+                    categoria=clasificar_consulta(problema),
+                    estado='pendiente',
+                )
+                transaction.on_commit(lambda: _EJECUTOR_ANALISIS.submit(
+                    _analizar_en_segundo_plano, busqueda.id, model, problema
+                ))
+                return redirect('core:resultado', busqueda_id=busqueda.id)
+
             # Llamada principal al servicio de IA - aquí es donde ocurre el análisis real
             resultado_llm = analizar_viabilidad(model, problema)
 
@@ -77,22 +155,78 @@ def home(request):
                 texto_problema=problema,  # El problema original descrito por el usuario
                 modelo=model,  # Qué modelo de IA se usó para el análisis
                 categoria=categoria,  # Clasificación automática del tipo de problema
-                resultado_llm=json.dumps(resultado_llm)  # Resultado completo convertido a JSON para almacenar
+                resultado_llm=orjson.dumps(resultado_llm).decode()  # Resultado completo convertido a JSON para almacenar
             )
     
             # Éxito: redirigir al usuario a ver los resultados detallados
             messages.success(request, 'Análisis completado exitosamente con IA avanzada.')
             return redirect('core:resultado', busqueda_id=busqueda.id)
 
-        except Exception as e:
+        except Exception:
             # Manejo de errores genérico - cualquier excepción durante el proceso
-            print(f"Error al procesar la consulta: {e}")
+            logger.exception("Error al procesar la consulta")
             messages.error(request, 'Hubo un error al conectar con el servicio de IA. Inténtalo nuevamente.')
             return redirect('core:home')
 
     # Método GET: simplemente mostrar el formulario de consulta vacío
     return render(request, 'core/home.html')
 
+def _evento_sse(evento, datos):
+    """Formatea un evento Server-Sent Events con los datos serializados en JSON."""
+    return f"event: {evento}\ndata: {orjson.dumps(datos).decode()}\n\n"
+
+
+@login_required
+@require_POST
+def analizar_stream(request):
+    """
+    Vista que realiza el análisis en streaming mediante Server-Sent Events.
+
+    Recibe el mismo formulario que home, pero en lugar de esperar a que el modelo
+    termine envía cada campo del análisis en cuanto está disponible (evento
+    "campo"). Al terminar guarda la búsqueda y envía un evento "fin" con la URL
+    del resultado, o un evento "error" si la consulta falla.
+    """
+    problema = request.POST.get('problema', '').strip()
+
+    if len(problema) < 10:
+        return JsonResponse(
+            {'error': 'La descripción del problema debe tener al menos 10 caracteres.'},
+            status=400,
+        )
+
+    model = request.POST.get('model', 'gemini').strip().lower()
+    if model not in ['gemini', 'cerebras']:
+        model = 'gemini'  # Valor por defecto si el usuario envía algo inválido
+
+    usuario = request.user
+
+    def eventos():
+        for evento, datos in analizar_viabilidad_stream(model, problema):
+            if evento == 'campo':
+                yield _evento_sse('campo', datos)
+            elif evento == 'error':
+                yield _evento_sse('error', datos)
+            elif evento == 'resultado':
+                # Persistencia igual que en home, una vez el análisis está completo
+                busqueda = Busqueda.objects.create(
+                    usuario=usuario,
+                    texto_problema=problema,
+                    modelo=model,
+                    categoria=clasificar_consulta(problema),
+                    resultado_llm=orjson.dumps(datos).decode()
+                )
+                yield _evento_sse('fin', {
+                    'busqueda_id': busqueda.id,
+                    'url': reverse('core:resultado', args=[busqueda.id]),
+                })
+
+    response = StreamingHttpResponse(eventos(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'  # Los eventos no deben quedar en ninguna caché intermedia
+    response['X-Accel-Buffering'] = 'no'  # Evita que nginx acumule la respuesta antes de enviarla
+    return response
+
+
 @login_required
 def resultado(request, busqueda_id):
     """
@@ -106,21 +240,37 @@ def resultado(request, busqueda_id):
     # Obtener la búsqueda específica del usuario (seguridad: solo puede ver sus propias búsquedas)
     busqueda = get_object_or_404(Busqueda, id=busqueda_id, usuario=request.user)
 
+    if busqueda.estado == 'pendiente':
+        limite = busqueda.fecha_creacion + timedelta(seconds=settings.ANALISIS_TIEMPO_MAXIMO)
+        if timezone.now() < limite:
+            # Análisis en segundo plano todavía en curso: página de espera que se
+            # recarga sola un número limitado de veces
+            try:
+                intento = max(0, int(request.GET.get('intento', 0)))
+            except ValueError:
+                intento = 0
+            return render(request, 'core/procesando.html', {
+                'busqueda': busqueda,
+                'siguiente_intento': intento + 1 if intento < INTENTOS_ESPERA_MAXIMOS else None,
+                'espera_ms': ESPERA_ENTRE_INTENTOS_MS,
+            }, status=202)
+        # Sigue pendiente pasado el límite: el hilo que lo analizaba no terminó
+        # (p. ej. el proceso se reinició), así que se trata como fallido
+        logger.warning("Análisis de la búsqueda %s pendiente más allá del límite", busqueda.id)
+
+    if busqueda.estado != 'completada' or busqueda.resultado_llm is None:
+        messages.error(request, 'El análisis no pudo completarse. Inténtalo nuevamente.')
+        return redirect('core:home')
+
     try:
         # Convertir el JSON almacenado de vuelta a diccionario Python para usar en template
-        resultado = json.loads(busqueda.resultado_llm)
-
-        # Cálculo de métrica adicional: promedio de viabilidad basado en los tres índices clave
-        if 'indices_clave' in resultado:
-            indices_clave = resultado['indices_clave']
-            adecuacion_ia = indices_clave.get('adecuacion_ia', {}).get('puntuacion', 0)
-            factibilidad_tecnica = indices_clave.get('factibilidad_tecnica', {}).get('puntuacion', 0)
-            impacto_potencial = indices_clave.get('impacto_potencial', {}).get('puntuacion', 0)
-            # Promedio simple de las tres puntuaciones principales
-            average = round((adecuacion_ia + factibilidad_tecnica + impacto_potencial) / 3)
-            resultado['average_viability'] = average
-
-    except json.JSONDecodeError:
+        resultado = orjson.loads(busqueda.resultado_llm)
+
+        # Promedio de viabilidad de los tres índices clave, calculado al guardar la búsqueda
+        if busqueda.puntuacion_media is not None:
+            resultado['average_viability'] = busqueda.puntuacion_media
+
+    except orjson.JSONDecodeError:  # Subclase de json.JSONDecodeError
         # Error si el JSON almacenado está corrupto (caso muy raro)
         messages.error(request, 'Error al cargar los resultados.')
         return redirect('core:home')  # Redirigir a home en lugar de 'subir' que no existe
@@ -140,17 +290,22 @@ def historial(request):
     en sus consultas y acceder nuevamente a resultados previos. Incluye
     estadísticas sobre tipos de problemas más consultados.
     """
-    # Obtener todas las consultas del usuario actual, ordenadas por fecha descendente
-    consultas = Busqueda.objects.filter(usuario=request.user)
-    consultas = consultas.order_by('-fecha_creacion')
+    # Los análisis en segundo plano fallidos quedan marcados, no se listan
+    mis_busquedas = Busqueda.objects.filter(usuario=request.user).exclude(estado='error')
+
+    # Obtener todas las consultas del usuario actual, ordenadas por fecha descendente.
+    # El listado no muestra el análisis: se omite resultado_llm, que es con diferencia
+    # la columna más pesada de cada fila
+    consultas = mis_busquedas.defer('resultado_llm').order_by('-fecha_creacion')
 
     # Generar estadísticas de uso por categoría para análisis de patrones
-    estadisticas_categoria = Busqueda.objects.filter(usuario=request.user).values('categoria').annotate(
+    estadisticas_categoria = list(mis_busquedas.values('categoria').annotate(
         total=Count('categoria')  # Contar ocurrencias de cada categoría
-    ).order_by('-total')  # Ordenar por frecuencia descendente
+    ).order_by('-total'))  # Ordenar por frecuencia descendente
 
-    # Calcular porcentajes para mostrar distribución de consultas por tipo
-    total_consultas_usuario = Busqueda.objects.filter(usuario=request.user).count()
+    # Calcular porcentajes para mostrar distribución de consultas por tipo. El total
+    # sale de las propias estadísticas (como mucho una fila por categoría), sin otro COUNT
+    total_consultas_usuario = sum(estadistica['total'] for estadistica in estadisticas_categoria)
     for estadistica in estadisticas_categoria:
         estadistica['porcentaje'] = round((estadistica['total'] / total_consultas_usuario) * 100) if total_consultas_usuario > 0 else 0
 
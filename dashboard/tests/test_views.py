@@ -1,6 +1,8 @@
+import json
 import pytest
 from django.test import TestCase, Client
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta
@@ -10,24 +12,23 @@ from core.models import Busqueda
 class DashboardViewsTest(TestCase):
     """Test suite for dashboard app views"""
 
-    def setUp(self):
-        """Set up test data"""
-        self.client = Client()
-        self.superuser = User.objects.create_superuser(
+    @classmethod
+    def setUpTestData(cls):
+        """Create the users and busquedas once for the whole class"""
+        cls.superuser = User.objects.create_superuser(
             username='admin',
             email='admin@example.com',
             password='admin123',
             is_staff=True
         )
-        self.client.login(username='admin', password='admin123')
 
         # Create test users and busquedas
-        self.user1 = User.objects.create_user(
+        cls.user1 = User.objects.create_user(
             username='user1',
             email='user1@example.com',
             password='pass123'
         )
-        self.user2 = User.objects.create_user(
+        cls.user2 = User.objects.create_user(
             username='user2',
             email='user2@example.com',
             password='pass123'
@@ -38,25 +39,34 @@ class DashboardViewsTest(TestCase):
         yesterday = now - timedelta(days=1)
         week_ago = now - timedelta(days=7)
 
-        Busqueda.objects.create(
-            usuario=self.user1,
-            texto_problema='Query 1',
-            categoria='Automatización',
-            fecha_creacion=now
-        )
-        Busqueda.objects.create(
-            usuario=self.user1,
-            texto_problema='Query 2',
-            categoria='Análisis de datos / predicción',
-            fecha_creacion=yesterday
-        )
-        Busqueda.objects.create(
-            usuario=self.user2,
-            texto_problema='Query 3',
-            categoria='Automatización',
-            fecha_creacion=week_ago,
-            resultado_llm='{"test": "result"}'
-        )
+        Busqueda.objects.bulk_create([
+            Busqueda(
+                usuario=cls.user1,
+                texto_problema='Query 1',
+                categoria='Automatización',
+                fecha_creacion=now
+            ),
+            Busqueda(
+                usuario=cls.user1,
+                texto_problema='Query 2',
+                categoria='Análisis de datos / predicción',
+                fecha_creacion=yesterday
+            ),
+            Busqueda(
+                usuario=cls.user2,
+                texto_problema='Query 3',
+                categoria='Automatización',
+                fecha_creacion=week_ago,
+                resultado_llm='{"test": "result"}'
+            ),
+        ])
+
+    def setUp(self):
+        """Log the superuser in without going through password verification"""
+        self.client = Client()
+        self.client.force_login(self.superuser)
+        # The panel context is cached; every test starts with fresh statistics
+        cache.clear()
 
     def test_panel_estadisticas_authenticated_superuser(self):
         """Test panel_estadisticas view for authenticated superuser"""
@@ -92,6 +102,16 @@ class DashboardViewsTest(TestCase):
         self.assertEqual(busquedas_por_categoria['automatizacion'], 2)
         self.assertEqual(busquedas_por_categoria['analisis_datos_prediccion'], 1)
 
+    def test_panel_estadisticas_conversion_rate(self):
+        """Test that only searches with a non-empty result count towards the conversion rate"""
+        Busqueda.objects.create(usuario=self.user2, texto_problema='Empty result', resultado_llm='')
+
+        response = self.client.get(reverse('dashboard:panel_estadisticas'))
+
+        # 1 of 4 searches has a stored result
+        self.assertEqual(response.context['total_busquedas'], 4)
+        self.assertEqual(response.context['tasa_conversion'], 25.0)
+
     def test_panel_estadisticas_chart_data(self):
         """Test that chart data is properly formatted"""
         response = self.client.get(reverse('dashboard:panel_estadisticas'))
@@ -108,6 +128,15 @@ class DashboardViewsTest(TestCase):
         self.assertIsInstance(json.loads(porcentaje_labels), list)
         self.assertIsInstance(json.loads(porcentaje_valores), list)
 
+    def test_panel_estadisticas_daily_chart_counts(self):
+        """Test that the daily chart has seven days and counts today's searches"""
+        response = self.client.get(reverse('dashboard:panel_estadisticas'))
+
+        valores = json.loads(response.context['valores_semanal'])
+        self.assertEqual(len(valores), 7)
+        # fecha_creacion is auto_now_add, so every fixture search is from today
+        self.assertEqual(valores, [0, 0, 0, 0, 0, 0, 3])
+
     def test_panel_estadisticas_display_names(self):
         """Test that display names are properly mapped"""
         response = self.client.get(reverse('dashboard:panel_estadisticas'))
@@ -152,6 +181,35 @@ class DashboardViewsTest(TestCase):
         promedio_puntuacion = response.context['promedio_puntuacion']
         self.assertIsInstance(promedio_puntuacion, float)
 
+    def test_panel_estadisticas_scoring_distribution(self):
+        """Test the average score and viability distribution over scored searches"""
+        for puntuaciones in ((85, 90, 80), (40, 50, 60), (10, 20, 30)):
+            indices = dict(zip(('adecuacion_ia', 'factibilidad_tecnica', 'impacto_potencial'),
+                               ({"puntuacion": p} for p in puntuaciones)))
+            Busqueda.objects.create(
+                usuario=self.user1,
+                texto_problema='Scored query',
+                resultado_llm=json.dumps({"indices_clave": indices})
+            )
+
+        response = self.client.get(reverse('dashboard:panel_estadisticas'))
+
+        # Averages per search: 85 (alta), 50 (media), 20 (baja)
+        self.assertEqual(response.context['promedio_puntuacion'], 51.7)
+        self.assertEqual(response.context['distribucion_porcentaje'], {'alta': 33.3, 'media': 33.3, 'baja': 33.3})
+
+    def test_panel_estadisticas_is_cached(self):
+        """Test that the statistics are reused from cache within the timeout"""
+        self.client.get(reverse('dashboard:panel_estadisticas'))
+        Busqueda.objects.create(usuario=self.user1, texto_problema='New query')
+
+        response = self.client.get(reverse('dashboard:panel_estadisticas'))
+        self.assertEqual(response.context['total_busquedas'], 3)
+
+        cache.clear()
+        response = self.client.get(reverse('dashboard:panel_estadisticas'))
+        self.assertEqual(response.context['total_busquedas'], 4)
+
     def test_panel_estadisticas_not_superuser(self):
         """Test that regular users cannot access dashboard"""
         # Login as regular user
@@ -5,5 +5,4 @@ app_name = 'dashboard'
 
 urlpatterns = [
     path('panel/', views.panel_estadisticas, name='panel_estadisticas'),
-    path('panel/', views.panel_estadisticas, name='panel'),
 ]
\ No newline at end of file
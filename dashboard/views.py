@@ -1,15 +1,32 @@
 import json
+from django.http import HttpResponseForbidden
 from django.shortcuts import render
 from django.contrib.admin.views.decorators import staff_member_required
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Avg
+from django.db.models import Count, Avg, Q
 from django.db.models.functions import TruncDate, TruncWeek
-from core.models import Busqueda
+from core.models import Busqueda, CATEGORIAS
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.utils import timezone
 from datetime import timedelta
 import calendar
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Clave y vigencia (segundos) del contexto cacheado del panel de estadísticas
+PANEL_CACHE_KEY = 'dashboard:panel_estadisticas'
+PANEL_CACHE_TIMEOUT = 60
+
+# Claves sin acentos ni espacios de cada categoría (mismo orden que CATEGORIAS),
+# usadas por la plantilla del panel, y su nombre para mostrar
+CATEGORIAS_SAFE = ('automatizacion', 'analisis_datos_prediccion', 'procesamiento_texto', 'procesamiento_imagenes_video', 'procesamiento_audio_voz', 'generacion_contenido', 'recomendacion_personalizacion', 'optimizacion_decision_inteligente', 'asistentes_conversacionales')
+DISPLAY_NAMES = dict(zip(CATEGORIAS_SAFE, CATEGORIAS))
+
+# Etiquetas del gráfico de distribución, ya serializadas para la plantilla
+PORCENTAJE_LABELS_JSON = json.dumps(['Alta Viabilidad (75%+)', 'Media Viabilidad (50-74%)', 'Baja Viabilidad (<50%)'])
 
 @login_required
 def panel_estadisticas(request):
@@ -18,47 +35,47 @@ def panel_estadisticas(request):
     """
     # Solo permitir acceso a superusuarios
     if not request.user.is_staff:
-        from django.http import HttpResponseForbidden
         return HttpResponseForbidden("Acceso denegado: Requiere permisos de staff")
-    import logging
-    logger = logging.getLogger(__name__)
 
-    # Log para debug del problema de reverse
-    logger.info("Intentando acceder a panel_estadisticas")
-    logger.info(f"Nombre de la vista: {request.resolver_match.view_name if request.resolver_match else 'None'}")
-    logger.info("Verificando configuración de URLs del dashboard")
+    # Las estadísticas recorren toda la tabla de búsquedas y son las mismas para
+    # cualquier miembro del staff: se calculan como mucho una vez por minuto
+    contexto = cache.get_or_set(PANEL_CACHE_KEY, _calcular_estadisticas, PANEL_CACHE_TIMEOUT)
 
-    # Estadísticas generales
-    total_busquedas = Busqueda.objects.count()
-    total_usuarios = User.objects.count()
-    # Usuarios con al menos una búsqueda (considerados "activos")
-    busquedas_activos = User.objects.filter(busqueda__isnull=False).distinct().count()
-
-    # Debug logging para validar la hipótesis
-    logger.info(f"Total usuarios registrados: {total_usuarios}")
-    logger.info(f"Usuarios con búsquedas (busquedas_activos): {busquedas_activos}")
-    logger.info(f"Porcentaje esperado: {(busquedas_activos / total_usuarios * 100) if total_usuarios > 0 else 0}%")
-
-    # Log detallado de usuarios
-    todos_usuarios = list(User.objects.values_list('username', flat=True))
-    logger.info(f"Lista de todos los usuarios registrados: {todos_usuarios}")
+    return render(request, 'dashboard/panel.html', contexto)
 
-    usuarios_con_busquedas = list(User.objects.filter(busqueda__isnull=False).distinct().values_list('username', flat=True))
-    logger.info(f"Usuarios con búsquedas: {usuarios_con_busquedas}")
 
-    # Verificar si hay sesiones activas (aproximación)
-    from django.contrib.sessions.models import Session
-    sesiones_activas = Session.objects.filter(expire_date__gt=timezone.now()).count()
-    logger.info(f"Número aproximado de sesiones activas: {sesiones_activas}")
+def _calcular_estadisticas():
+    """
+    Calcula el contexto completo del panel de estadísticas.
 
-    # Estadísticas de los últimos 30 días
+    Retorna:
+        Diccionario con los conteos, datos de gráficos y puntuaciones del panel
+    """
+    # Estadísticas generales y de los últimos 30 días: todos los conteos sobre
+    # Busqueda en una sola consulta con agregación condicional
     hace_30_dias = timezone.now() - timedelta(days=30)
-    busquedas_mes = Busqueda.objects.filter(fecha_creacion__gte=hace_30_dias).count()
-    usuarios_mes = (Busqueda.objects.filter(fecha_creacion__gte=hace_30_dias)
-                   .values('usuario').distinct().count())
+    del_mes = Q(fecha_creacion__gte=hace_30_dias)
+    resumen = Busqueda.objects.order_by().aggregate(
+        total_busquedas=Count('id'),
+        # Usuarios con al menos una búsqueda (considerados "activos")
+        busquedas_activos=Count('usuario', distinct=True),
+        busquedas_mes=Count('id', filter=del_mes),
+        usuarios_mes=Count('usuario', distinct=True, filter=del_mes),
+        # Búsquedas con resultado_llm válido (no nulo y no vacío)
+        busquedas_con_resultado=Count('id', filter=Q(resultado_llm__isnull=False) & ~Q(resultado_llm='')),
+    )
+    total_busquedas = resumen['total_busquedas']
+    busquedas_activos = resumen['busquedas_activos']
+    busquedas_mes = resumen['busquedas_mes']
+    usuarios_mes = resumen['usuarios_mes']
+    busquedas_con_resultado = resumen['busquedas_con_resultado']
+    total_usuarios = User.objects.count()
+
+    logger.debug("Total usuarios registrados: %s", total_usuarios)
+    logger.debug("Usuarios con búsquedas (busquedas_activos): %s", busquedas_activos)
 
-    # Top usuarios más activos (últimos 30 días)
-    usuarios_activos = (Busqueda.objects.filter(fecha_creacion__gte=hace_30_dias)
+    # Top usuarios más activos (últimos 30 días); se evalúa aquí para poder cachearlo
+    usuarios_activos = list(Busqueda.objects.filter(fecha_creacion__gte=hace_30_dias)
                        .values('usuario__username', 'usuario__first_name', 'usuario__last_name')
                        .annotate(num_busquedas=Count('id'))
                        .order_by('-num_busquedas')[:10])
@@ -75,11 +92,13 @@ def panel_estadisticas(request):
     fechas = []
     valores = []
 
+    # Una sola consulta para los siete días; los días sin búsquedas no aparecen
+    cantidad_por_fecha = {fila['fecha']: fila['cantidad'] for fila in busquedas_por_dia}
+    hoy = timezone.now().date()
     for i in range(6, -1, -1):
-        fecha = timezone.now().date() - timedelta(days=i)
-        cantidad = busquedas_por_dia.filter(fecha=fecha).first()
+        fecha = hoy - timedelta(days=i)
         fechas.append(fecha.strftime('%d/%m'))
-        valores.append(cantidad['cantidad'] if cantidad else 0)
+        valores.append(cantidad_por_fecha.get(fecha, 0))
 
     # Búsquedas por semana (últimos 4 semaines)
     hace_28_dias = timezone.now() - timedelta(days=28)
@@ -89,55 +108,29 @@ def panel_estadisticas(request):
                            .annotate(cantidad=Count('id'))
                            .order_by('semana'))
 
-    # Estadísticas por categorías
-    categorias = ['Automatización', 'Análisis de datos / predicción', 'Procesamiento de texto', 'Procesamiento de imágenes / video', 'Procesamiento de audio / voz', 'Generación de contenido', 'Recomendación / personalización', 'Optimización / decisión inteligente', 'Asistentes conversacionales']
-    categorias_safe = ['automatizacion', 'analisis_datos_prediccion', 'procesamiento_texto', 'procesamiento_imagenes_video', 'procesamiento_audio_voz', 'generacion_contenido', 'recomendacion_personalizacion', 'optimizacion_decision_inteligente', 'asistentes_conversacionales']
-    busquedas_por_categoria = {}
-    for categoria, safe_key in zip(categorias, categorias_safe):
-        busquedas_por_categoria[safe_key] = Busqueda.objects.filter(categoria=categoria).count()
-
-    # Diccionario para nombres de display
-    display_names = dict(zip(categorias_safe, categorias))
+    # Estadísticas por categorías: un único GROUP BY en lugar de un COUNT por categoría
+    conteo_por_categoria = dict(Busqueda.objects.order_by().values_list('categoria').annotate(cantidad=Count('id')))
+    busquedas_por_categoria = {
+        safe_key: conteo_por_categoria.get(categoria, 0)
+        for categoria, safe_key in zip(CATEGORIAS, CATEGORIAS_SAFE)
+    }
 
     # Estadísticas promedio
     promedio_puntuacion = 0
     distribucion_porcentaje = {'alta': 0, 'media': 0, 'baja': 0}
 
-    # Inicializar busquedas_con_resultados para evitar NameError si no hay búsquedas
-    busquedas_con_resultados = Busqueda.objects.none()
-
-    logger.info(f"Busqueda.objects.exists(): {Busqueda.objects.exists()}")
-
-    if Busqueda.objects.exists():
-        # Calcular promedio de puntuaje general calculando average_viability on-the-fly
-        busquedas_con_resultados = Busqueda.objects.exclude(resultado_llm__isnull=True).exclude(resultado_llm='')
-        logger.info(f"busquedas_con_resultados definido con count: {busquedas_con_resultados.count()}")
-
-        if busquedas_con_resultados:
-            suma = 0
-            count = 0
-            for b in busquedas_con_resultados:
-                try:
-                    resultado = json.loads(b.resultado_llm)
-                    if 'indices_clave' in resultado:
-                        indices_clave = resultado['indices_clave']
-                        adecuacion_ia = indices_clave.get('adecuacion_ia', {}).get('puntuacion', 0)
-                        factibilidad_tecnica = indices_clave.get('factibilidad_tecnica', {}).get('puntuacion', 0)
-                        impacto_potencial = indices_clave.get('impacto_potencial', {}).get('puntuacion', 0)
-                        puntuacion = round((adecuacion_ia + factibilidad_tecnica + impacto_potencial) / 3)
-                        suma += puntuacion
-                        count += 1
-                        # Clasificar por rangos: Alta (75%+), Media (50-74%), Baja (<50%)
-                        if puntuacion >= 75:
-                            distribucion_porcentaje['alta'] += 1
-                        elif puntuacion >= 50:
-                            distribucion_porcentaje['media'] += 1
-                        else:
-                            distribucion_porcentaje['baja'] += 1
-                except (json.JSONDecodeError, TypeError, ZeroDivisionError):
-                    continue
-
-            promedio_puntuacion = suma / count if count > 0 else 0
+    if busquedas_con_resultado:
+        # Promedio y distribución en una sola consulta sobre el promedio que cada
+        # búsqueda guarda al crearse, sin traer ni parsear el JSON de cada análisis
+        estadisticas = Busqueda.objects.filter(puntuacion_media__isnull=False).aggregate(
+            promedio=Avg('puntuacion_media'),
+            # Clasificar por rangos: Alta (75%+), Media (50-74%), Baja (<50%)
+            alta=Count('id', filter=Q(puntuacion_media__gte=75)),
+            media=Count('id', filter=Q(puntuacion_media__gte=50, puntuacion_media__lt=75)),
+            baja=Count('id', filter=Q(puntuacion_media__lt=50)),
+        )
+        promedio_puntuacion = estadisticas.pop('promedio') or 0
+        distribucion_porcentaje.update(estadisticas)
 
     # Convertir distribucion_porcentaje a porcentajes
     total_con_puntuacion = sum(distribucion_porcentaje.values())
@@ -148,7 +141,6 @@ def panel_estadisticas(request):
             )
 
     # Datos para gráfico de distribución
-    porcentaje_labels = ['Alta Viabilidad (75%+)', 'Media Viabilidad (50-74%)', 'Baja Viabilidad (<50%)']
     porcentaje_valores = [
         distribucion_porcentaje['alta'],
         distribucion_porcentaje['media'],
@@ -156,12 +148,10 @@ def panel_estadisticas(request):
     ]
 
     # Cálculo de la tasa de conversión
-    # Número de búsquedas con resultado_llm válido (no nulo y no vacío)
-    busquedas_con_resultado = busquedas_con_resultados.count()
     # Porcentaje: (búsquedas_con_resultado / total_busquedas) * 100
     tasa_conversion = round((busquedas_con_resultado / total_busquedas) * 100, 1) if total_busquedas > 0 else 0.0
 
-    contexto = {
+    return {
         # Estadísticas generales
         'total_busquedas': total_busquedas,
         'total_usuarios': total_usuarios,
@@ -177,7 +167,7 @@ def panel_estadisticas(request):
         # Datos para gráficos
         'fechas_semanal': json.dumps(fechas),
         'valores_semanal': json.dumps(valores),
-        'porcentaje_labels': json.dumps(porcentaje_labels),
+        'porcentaje_labels': PORCENTAJE_LABELS_JSON,
         'porcentaje_valores': json.dumps(porcentaje_valores),
 
         # Estadísticas avanzadas
@@ -187,10 +177,8 @@ def panel_estadisticas(request):
 
         # Estadísticas por categorías
         'busquedas_por_categoria': busquedas_por_categoria,
-        'display_names': display_names,
+        'display_names': DISPLAY_NAMES,
 
         # Fecha actual
         'fecha_actual': timezone.now().date(),
     }
-
-    return render(request, 'dashboard/panel.html', contexto)
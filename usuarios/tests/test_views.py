@@ -1,13 +1,50 @@
 import pytest
-from django.test import TestCase, Client
+from django.test import SimpleTestCase, TestCase, Client
 from django.contrib.auth.models import User
-from django.urls import reverse
+from django.urls import reverse, set_script_prefix
 from django.contrib.auth import authenticate
 
 
+class UsuariosAnonymousGetTest(SimpleTestCase):
+    """Anonymous GET requests to the usuarios pages, which must not touch the database"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.url_register = reverse('usuarios:register')
+        cls.url_login = reverse('usuarios:login')
+
+    def test_register_view_get(self):
+        """Test register view GET request"""
+        response = self.client.get(self.url_register)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'usuarios/register.html')
+
+    def test_login_view_get(self):
+        """Test login view GET request"""
+        response = self.client.get(self.url_login)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'usuarios/login.html')
+
+
 class UsuariosViewsTest(TestCase):
     """Test suite for usuarios app views"""
 
+    @classmethod
+    def setUpTestData(cls):
+        """Create the already registered user once for the whole class"""
+        # Different username from user_data, which the registration tests create
+        cls.password = 'TestPass123!'
+        cls.user = User.objects.create_user(
+            username='existinguser',
+            email='existing@example.com',
+            password=cls.password
+        )
+        cls.url_register = reverse('usuarios:register')
+        cls.url_login = reverse('usuarios:login')
+        cls.url_logout = reverse('usuarios:logout')
+        cls.url_home = reverse('core:home')
+
     def setUp(self):
         """Set up test data"""
         self.client = Client()
@@ -18,15 +55,11 @@ class UsuariosViewsTest(TestCase):
             'password2': 'TestPass123!'
         }
 
-    def test_register_view_get(self):
-        """Test register view GET request"""
-        response = self.client.get(reverse('usuarios:register'))
-        self.assertEqual(response.status_code, 200)
-        self.assertTemplateUsed(response, 'usuarios/register.html')
-
     def test_register_view_post_valid(self):
         """Test register view POST request with valid data"""
-        response = self.client.post(reverse('usuarios:register'), self.user_data)
+        # Two username uniqueness checks (form and model) plus the INSERT
+        with self.assertNumQueries(3):
+            response = self.client.post(self.url_register, self.user_data)
         self.assertEqual(response.status_code, 302)  # Redirect after successful registration
 
         # Check that user was created
@@ -39,7 +72,7 @@ class UsuariosViewsTest(TestCase):
         invalid_data = self.user_data.copy()
         invalid_data['password2'] = 'DifferentPass123!'  # Passwords don't match
 
-        response = self.client.post(reverse('usuarios:register'), invalid_data)
+        response = self.client.post(self.url_register, invalid_data)
         self.assertEqual(response.status_code, 200)  # Stay on form
         self.assertContains(response, 'error')  # Should show error
 
@@ -49,55 +82,33 @@ class UsuariosViewsTest(TestCase):
 
     def test_register_view_post_duplicate_username(self):
         """Test register view POST request with duplicate username"""
-        # Create user first
-        User.objects.create_user(
-            username='testuser',
-            email='existing@example.com',
-            password='ExistingPass123!'
-        )
+        duplicate_data = self.user_data.copy()
+        duplicate_data['username'] = self.user.username
 
-        response = self.client.post(reverse('usuarios:register'), self.user_data)
+        response = self.client.post(self.url_register, duplicate_data)
         self.assertEqual(response.status_code, 200)  # Stay on form
         self.assertContains(response, 'error')  # Should show error
 
-    def test_login_view_get(self):
-        """Test login view GET request"""
-        response = self.client.get(reverse('usuarios:login'))
-        self.assertEqual(response.status_code, 200)
-        self.assertTemplateUsed(response, 'usuarios/login.html')
-
     def test_login_view_post_valid(self):
         """Test login view POST request with valid credentials"""
-        # Create user
-        User.objects.create_user(
-            username='testuser',
-            email='test@example.com',
-            password='TestPass123!'
-        )
-
         login_data = {
-            'username': 'testuser',
-            'password': 'TestPass123!'
+            'username': self.user.username,
+            'password': self.password
         }
 
-        response = self.client.post(reverse('usuarios:login'), login_data)
+        # User lookup, session create and cycle, last_login update
+        with self.assertNumQueries(9):
+            response = self.client.post(self.url_login, login_data)
         self.assertEqual(response.status_code, 302)  # Redirect after successful login
 
     def test_login_view_post_invalid_credentials(self):
         """Test login view POST request with invalid credentials"""
-        # Create user
-        User.objects.create_user(
-            username='testuser',
-            email='test@example.com',
-            password='TestPass123!'
-        )
-
         invalid_login_data = {
-            'username': 'testuser',
+            'username': self.user.username,
             'password': 'WrongPass123!'
         }
 
-        response = self.client.post(reverse('usuarios:login'), invalid_login_data)
+        response = self.client.post(self.url_login, invalid_login_data)
         self.assertEqual(response.status_code, 200)  # Stay on form
         self.assertContains(response, 'Credenciales inválidas')  # Should show error
 
@@ -108,88 +119,80 @@ class UsuariosViewsTest(TestCase):
             'password': 'SomePass123!'
         }
 
-        response = self.client.post(reverse('usuarios:login'), login_data)
+        response = self.client.post(self.url_login, login_data)
         self.assertEqual(response.status_code, 200)  # Stay on form
         self.assertContains(response, 'Credenciales inválidas')  # Should show error
 
     def test_logout_view(self):
         """Test logout view"""
-        # Create and login user
-        user = User.objects.create_user(
-            username='testuser',
-            email='test@example.com',
-            password='TestPass123!'
-        )
-        self.client.login(username='testuser', password='TestPass123!')
+        # Login user
+        self.client.force_login(self.user)
 
         # Verify user is logged in
-        self.assertEqual(int(self.client.session['_auth_user_id']), user.pk)
+        self.assertEqual(int(self.client.session['_auth_user_id']), self.user.pk)
 
         # Logout
-        response = self.client.get(reverse('usuarios:logout'))
+        response = self.client.get(self.url_logout)
         self.assertEqual(response.status_code, 302)  # Redirect after logout
 
         # Verify user is logged out
-        response = self.client.get(reverse('core:home'))
+        response = self.client.get(self.url_home)
         self.assertEqual(response.status_code, 302)  # Should redirect to login
 
+    def test_logout_view_anonymous(self):
+        """Test that anonymous logout redirects home without adding a message"""
+        response = self.client.get(self.url_logout)
+        self.assertRedirects(response, self.url_home, fetch_redirect_response=False)
+        self.assertNotIn('_messages', self.client.session)
+
+    def test_logout_view_redirect_keeps_script_prefix(self):
+        """Test that the cached home redirect follows the request's script prefix"""
+        self.addCleanup(set_script_prefix, '/')
+        self.client.get(self.url_logout)  # Cache the home path under the default prefix
+
+        # The test client does not set the prefix from SCRIPT_NAME as WSGIHandler does
+        set_script_prefix('/app/')
+        response = self.client.get(self.url_logout)
+        self.assertEqual(response['Location'], '/app' + self.url_home)
+
+    def test_logout_view_rejects_other_methods(self):
+        """Test that logout only accepts GET and POST"""
+        response = self.client.put(self.url_logout)
+        self.assertEqual(response.status_code, 405)
+
     def test_register_redirect_authenticated_user(self):
         """Test that authenticated users are redirected from register page"""
-        # Create and login user
-        User.objects.create_user(
-            username='testuser',
-            email='test@example.com',
-            password='TestPass123!'
-        )
-        self.client.login(username='testuser', password='TestPass123!')
+        # Login user
+        self.client.force_login(self.user)
 
-        response = self.client.get(reverse('usuarios:register'))
+        response = self.client.get(self.url_register)
         self.assertEqual(response.status_code, 302)  # Should redirect
 
     def test_login_redirect_authenticated_user(self):
         """Test that authenticated users are redirected from login page"""
-        # Create and login user
-        User.objects.create_user(
-            username='testuser',
-            email='test@example.com',
-            password='TestPass123!'
-        )
-        self.client.login(username='testuser', password='TestPass123!')
+        # Login user
+        self.client.force_login(self.user)
 
-        response = self.client.get(reverse('usuarios:login'))
+        response = self.client.get(self.url_login)
         self.assertEqual(response.status_code, 302)  # Should redirect
 
-    def test_user_creation_edge_cases(self):
-        """Test user creation with edge cases"""
-        # Test with very long username
-        long_username_data = self.user_data.copy()
-        long_username_data['username'] = 'a' * 151  # One character over the limit
-
-        response = self.client.post(reverse('usuarios:register'), long_username_data)
-        self.assertEqual(response.status_code, 200)  # Should fail validation
-
-        # Test with invalid email
-        invalid_email_data = self.user_data.copy()
-        invalid_email_data['email'] = 'invalid-email'
-
-        response = self.client.post(reverse('usuarios:register'), invalid_email_data)
-        self.assertEqual(response.status_code, 200)  # Should fail validation
-        self.assertContains(response, 'error')
-
-    def test_password_validation(self):
-        """Test password validation during registration"""
-        # Test with very short password
-        short_pass_data = self.user_data.copy()
-        short_pass_data['password1'] = '123'
-        short_pass_data['password2'] = '123'
-
-        response = self.client.post(reverse('usuarios:register'), short_pass_data)
-        self.assertEqual(response.status_code, 200)  # Should fail validation
-
-        # Test with common password
-        common_pass_data = self.user_data.copy()
-        common_pass_data['password1'] = 'password'
-        common_pass_data['password2'] = 'password'
-
-        response = self.client.post(reverse('usuarios:register'), common_pass_data)
-        self.assertEqual(response.status_code, 200)  # Should fail validation
\ No newline at end of file
+    def test_register_invalid_fields(self):
+        """Test registration edge cases that must fail form validation"""
+        cases = [
+            ('username', 'a' * 151),  # One character over the limit
+            ('email', 'invalid-email'),
+            ('password', '123'),  # Too short
+            ('password', 'password'),  # Too common
+        ]
+        for field, value in cases:
+            with self.subTest(field=field, value=value):
+                data = self.user_data.copy()
+                if field == 'password':
+                    data['password1'] = data['password2'] = value
+                else:
+                    data[field] = value
+
+                response = self.client.post(self.url_register, data)
+                self.assertEqual(response.status_code, 200)  # Should fail validation
+                self.assertContains(response, 'error')
+                self.assertFalse(User.objects.filter(username=data['username']).exists())
@@ -1,16 +1,40 @@
-from django.shortcuts import render, redirect
-from django.urls import reverse_lazy, reverse
+from django.shortcuts import render
+from django.http import HttpResponseRedirect
+from django.urls import reverse_lazy, reverse, get_script_prefix, get_urlconf
+from django.utils.encoding import iri_to_uri
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import views as auth_views, logout, authenticate, login
 from django.contrib.auth.models import User
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import CreateView
 from django.contrib import messages
+from django.views.decorators.http import require_http_methods
 from django import forms
+import functools
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+@functools.cache
+def _ruta_inicio(urlconf):
+    """
+    Ruta de core:home sin el prefijo de script, resuelta una sola vez por URLconf.
+
+    El prefijo (SCRIPT_NAME) se antepone en cada redirección, de modo que la
+    misma entrada sirve para cualquier prefijo.
+    """
+    return reverse('core:home', urlconf=urlconf).removeprefix(iri_to_uri(get_script_prefix()))
+
+
+def _redirigir_inicio():
+    """Redirección a core:home sin recorrer el URLconf en cada petición"""
+    # get_urlconf() es el URLconf de la petición en curso (request.urlconf si
+    # algún middleware lo fija)
+    ruta = _ruta_inicio(get_urlconf())
+    return HttpResponseRedirect(iri_to_uri(get_script_prefix()) + ruta)
+
+
 class UserRegisterForm(UserCreationForm):
     """
     Formulario personalizado para registro que incluye email
@@ -21,13 +45,6 @@ class UserRegisterForm(UserCreationForm):
         model = User
         fields = ['username', 'email', 'password1', 'password2']
 
-    def save(self, commit=True):
-        user = super().save(commit=False)
-        user.email = self.cleaned_data['email']
-        if commit:
-            user.save()
-        return user
-
 class CustomLoginView(auth_views.LoginView):
     """
     Vista de login personalizada que redirige usuarios autenticados
@@ -36,10 +53,10 @@ class CustomLoginView(auth_views.LoginView):
 
     def get(self, request, *args, **kwargs):
         """Redirige a usuarios ya autenticados"""
-        logger.debug(f"CustomLoginView.get: user.is_authenticated = {request.user.is_authenticated}")
+        logger.debug("CustomLoginView.get: user.is_authenticated = %s", request.user.is_authenticated)
         if request.user.is_authenticated:
             logger.debug("Redirecting authenticated user from login page")
-            return redirect('core:home')
+            return _redirigir_inicio()
         return super().get(request, *args, **kwargs)
 
     def form_valid(self, form):
@@ -49,8 +66,9 @@ class CustomLoginView(auth_views.LoginView):
 
     def form_invalid(self, form):
         """Manejo adicional al login fallido"""
-        logger.debug(f"CustomLoginView.form_invalid: form.errors = {form.errors}")
-        logger.debug(f"CustomLoginView.form_invalid: form.non_field_errors = {form.non_field_errors()}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("CustomLoginView.form_invalid: form.errors = %s", form.errors)
+            logger.debug("CustomLoginView.form_invalid: form.non_field_errors = %s", form.non_field_errors())
         return super().form_invalid(form)
 
 class RegisterView(CreateView):
@@ -64,30 +82,36 @@ class RegisterView(CreateView):
 
     def form_valid(self, form):
         """Método llamado cuando el formulario es válido"""
-        logger.debug(f"RegisterView.form_valid: Saving user with email = {form.cleaned_data.get('email')}")
+        logger.debug("RegisterView.form_valid: Saving user with email = %s", form.cleaned_data.get('email'))
         response = super().form_valid(form)
         messages.success(self.request, f'Usuario {self.object.username} creado exitosamente. Ahora puedes iniciar sesión.')
-        logger.debug(f"RegisterView.form_valid: User saved with email = {self.object.email}")
+        logger.debug("RegisterView.form_valid: User saved with email = %s", self.object.email)
         return response
 
     def form_invalid(self, form):
         """Manejo adicional al registro fallido"""
-        logger.debug(f"RegisterView.form_invalid: form.errors = {form.errors}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("RegisterView.form_invalid: form.errors = %s", form.errors)
         return super().form_invalid(form)
 
     def get(self, request, *args, **kwargs):
         """Redirige a usuarios ya autenticados"""
-        logger.debug(f"RegisterView.get: user.is_authenticated = {request.user.is_authenticated}")
+        logger.debug("RegisterView.get: user.is_authenticated = %s", request.user.is_authenticated)
         if self.request.user.is_authenticated:
             logger.debug("Redirecting authenticated user from register page")
-            return redirect('core:home')
+            return _redirigir_inicio()
         return super().get(request, *args, **kwargs)
 
 
+@require_http_methods(["GET", "POST"])
 def logout_view(request):
     """
     Vista personalizada de logout que acepta GET requests para la navegación
     """
+    # Un visitante anónimo no tiene sesión que cerrar: se evita el flush de la
+    # sesión y la escritura del mensaje
+    if not request.user.is_authenticated:
+        return _redirigir_inicio()
     logout(request)
     messages.success(request, 'Has cerrado sesión exitosamente.')
-    return redirect('core:home')
+    return _redirigir_inicio()